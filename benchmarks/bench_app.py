@@ -0,0 +1,73 @@
+# The WebApp served by the end-to-end benchmarks, one route per kind of
+# response, run it standalone under CPython or micropython with:
+#     python3 benchmarks/bench_app.py [PORT]
+import sys
+import bench_util
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ucollections import OrderedDict #micropython specific
+
+from pawpaw import WebApp, Router, route, Template, LazyTemplate
+
+TEST_DATA = bench_util._ROOT + "/pawpaw/test_data"
+DEFAULT_PORT = 8790
+
+PIN_NUMBERS = (0, 2, 4, 5, 12, 13, 14, 15)
+PINS = OrderedDict((i, i % 5 == 0) for i in PIN_NUMBERS)
+
+#the routes exercised by the load generator, name -> request path
+ROUTES = OrderedDict((
+    ("exact_path", "/ping"),
+    ("regex",      "/pin/12"),
+    ("send_json",  "/pins.json"),
+    ("send_file",  "/pins.js"),
+    ("lazy_page",  "/pins"),
+))
+
+@Router
+class BenchApp(WebApp):
+    @route(path="/ping")
+    def ping(self, context):
+        context.render_template(Template(text="pong"))
+
+    @route(regex=r"/pin/(\d+)")
+    def pin(self, context):
+        pin_num = int(context.request.match.group(1))
+        context.send_json({"pin": pin_num, "value": PINS.get(pin_num)})
+
+    @route(path="/pins.json")
+    def pins_json(self, context):
+        context.send_json(dict(("pin%d" % n, v) for n, v in PINS.items()))
+
+    @route(path="/pins.js")
+    def pins_js(self, context):
+        context.send_file(TEST_DATA + "/pins.js")
+
+    @route(path="/pins")
+    def pins_page(self, context):
+        #the nested LazyTemplate page, one table row per pin
+        row_tmp = Template.from_file(TEST_DATA + "/pins_table_row.html")
+        def gen_table_content():
+            for pin_num, val in PINS.items():
+                row_tmp.format(pin_id = str(pin_num),
+                               pin_value = 'HIGH' if val else 'LOW')
+                for line in row_tmp.render():
+                    yield line
+        page_tmp = LazyTemplate.from_file(TEST_DATA + "/pins.html")
+        page_tmp.format(table_content = gen_table_content(),
+                        comment = 'benchmark page',
+                        javascript = LazyTemplate.from_file(TEST_DATA + "/pins.js"))
+        context.render_template(page_tmp)
+
+def main(port = DEFAULT_PORT, **kwargs):
+    app = BenchApp(server_addr = "127.0.0.1", server_port = port, log_dir = ".", **kwargs)
+    print("serving on port %d" % port)
+    app.serve_forever()
+
+if __name__ == "__main__":
+    port = DEFAULT_PORT
+    if len(sys.argv) > 1:
+        port = int(sys.argv[1])
+    main(port)
@@ -0,0 +1,244 @@
+# Isolated micro-benchmarks of the request pipeline components, each timed and
+# measured for heap allocation per call, optionally saved as JSON:
+#     python3 benchmarks/bench_components.py [OUTPUT.json]
+#     micropython benchmarks/bench_components.py
+import sys
+import bench_util
+
+try:
+    import json
+except ImportError:
+    import ujson as json #micropython specific
+
+try:
+    from io import BytesIO, StringIO
+except ImportError:
+    from uio import BytesIO, StringIO
+
+try:
+    import re
+except ImportError:
+    import ure as re
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ucollections import OrderedDict #micropython specific
+
+from pawpaw import Template, LazyTemplate, AutoTreeFormat, url_tools
+from pawpaw.template_engine import CompiledTemplate
+from pawpaw.http_connection_reader import HttpConnectionReader, HttpRequest
+from pawpaw.http_connection_writer import HttpConnectionWriter
+from pawpaw.http_server import HttpServer
+
+TEST_DATA = bench_util._ROOT + "/pawpaw/test_data"
+
+#-------------------------------------------------------------------------------
+# parser
+FORM_BODY = b"wifi.ssid=my%20home&wifi.pw=secret&rate=1.5&x=1"
+REQUEST_FIXTURES = OrderedDict((
+    ("GET simple", b"GET /pins HTTP/1.1\r\nHost: 192.168.4.1\r\n\r\n"),
+    ("GET browser", b"GET /pins?btn_id=btn12&x=1 HTTP/1.1\r\n"
+                    b"Host: 192.168.4.1\r\n"
+                    b"User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/115.0\r\n"
+                    b"Accept: text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8\r\n"
+                    b"Accept-Language: en-US,en;q=0.5\r\n"
+                    b"Accept-Encoding: gzip, deflate\r\n"
+                    b"Connection: keep-alive\r\n"
+                    b"Upgrade-Insecure-Requests: 1\r\n\r\n"),
+    ("POST form", b"POST /config HTTP/1.1\r\nHost: 192.168.4.1\r\n"
+                  b"Content-Type: application/x-www-form-urlencoded\r\n"
+                  + ("Content-Length: %d\r\n\r\n" % len(FORM_BODY)).encode() + FORM_BODY),
+))
+
+def bench_parser():
+    results = []
+    for name, raw in REQUEST_FIXTURES.items():
+        def parse():
+            HttpConnectionReader(BytesIO(raw), ("127.0.0.1", 0)).parse_request()
+        results.append(bench_util.bench_alloc("parse_request: %s" % name, parse, number = 500))
+    #the same with the reader and request reused, as HttpServer.pool_requests
+    reader  = HttpConnectionReader(None, None)
+    request = HttpRequest()
+    for name, raw in REQUEST_FIXTURES.items():
+        def parse_pooled():
+            reader.reset(BytesIO(raw), ("127.0.0.1", 0))
+            reader.parse_request(request)
+            request.reset()
+        results.append(bench_util.bench_alloc("pooled parse_request: %s" % name, parse_pooled, number = 500))
+    return results
+
+#-------------------------------------------------------------------------------
+# router
+class _Request(object):
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.match = None
+
+class _RegistryApp(object):
+    #just the registries that HttpServer.lookup_handler reads
+    def __init__(self, n_paths, n_regexs):
+        handler = lambda context: None
+        paths = OrderedDict(("/route/%d" % i, handler) for i in range(n_paths))
+        regexs = OrderedDict()
+        for i in range(n_regexs):
+            regex = re.compile(r"/item%d/(\d+)" % i)
+            regexs[repr(regex)] = (regex, handler)
+        self.path_handler_registry = OrderedDict((("GET", paths), ("DEFAULT", handler)))
+        self.regex_handler_registry = OrderedDict((("GET", regexs),))
+
+def bench_router():
+    results = []
+    for n_paths, n_regexs in ((10, 10), (200, 50)):
+        server = HttpServer(("127.0.0.1", 0), app = _RegistryApp(n_paths, n_regexs),
+                            init_socket = False)
+        server.socket.close()
+        for label, path in (("exact", "/route/%d" % (n_paths - 1)),
+                            ("last regex", "/item%d/7" % (n_regexs - 1)),
+                            ("miss", "/nowhere")):
+            req = _Request("GET", path)
+            results.append(bench_util.bench_alloc(
+                "lookup %d paths/%d regexs: %s" % (n_paths, n_regexs, label),
+                lambda: server.lookup_handler(req), number = 500))
+    return results
+
+#-------------------------------------------------------------------------------
+# templates
+class _CompiledModule(object):
+    #stands in for a module made by tools/compile_templates.py
+    def __init__(self, text):
+        sys.path.append(bench_util._ROOT + "/tools")
+        from compile_templates import compile_template
+        namespace = {}
+        exec(compile_template(text), namespace)
+        self.render = namespace['render']
+        self.TAGS   = namespace['TAGS']
+
+def bench_templates():
+    with open(TEST_DATA + "/pins_table_row.html") as f:
+        row_text = f.read()
+    with open(TEST_DATA + "/pins.html") as f:
+        page_text = f.read()
+    with open(TEST_DATA + "/pins.js") as f:
+        js_text = f.read()
+    row_tmp = Template(text = row_text)
+    def render_row():
+        row_tmp.format(pin_id = "12", pin_value = "HIGH")
+        row_tmp.render().read()
+    def iter_page():
+        def gen_rows():
+            for pin in (0, 2, 4, 5, 12, 13, 14, 15):
+                row_tmp.format(pin_id = str(pin), pin_value = "LOW")
+                for line in row_tmp.render():
+                    yield line
+        tmp = LazyTemplate.from_text(page_text)
+        tmp.format(table_content = gen_rows(), comment = "bench",
+                   javascript = LazyTemplate.from_text(js_text))
+        for line in tmp:
+            pass
+    page_mod = _CompiledModule(page_text)
+    row_mod  = _CompiledModule(row_text)
+    js_mod   = _CompiledModule(js_text)
+    def iter_compiled_page():
+        def gen_rows():
+            for pin in (0, 2, 4, 5, 12, 13, 14, 15):
+                for chunk in CompiledTemplate(row_mod).format(pin_id = str(pin),
+                                                              pin_value = "LOW"):
+                    yield chunk
+        tmp = CompiledTemplate(page_mod)
+        tmp.format(table_content = gen_rows(), comment = "bench",
+                   javascript = CompiledTemplate(js_mod))
+        for chunk in tmp:
+            pass
+    return [
+        bench_util.bench_alloc("Template.render pins_table_row", render_row, number = 500),
+        bench_util.bench_alloc("Template scan pins.html", lambda: Template(text = page_text), number = 500),
+        bench_util.bench_alloc("LazyTemplate iter nested pins page", iter_page, number = 100),
+        bench_util.bench_alloc("CompiledTemplate iter nested pins page", iter_compiled_page, number = 100),
+    ]
+
+#-------------------------------------------------------------------------------
+# writer, responses are written into an in-memory file
+PINS = dict(("pin%d" % i, i % 2) for i in range(16))
+SNAPSHOTS = [PINS]*50
+
+def bench_writer():
+    out = BytesIO()
+    writer = HttpConnectionWriter(out, None)
+    pong = Template(text = "pong")
+    def reset():
+        out.seek(0)
+        out.truncate()
+    def render_small():
+        reset()
+        writer.render_template(pong)
+    def render_chunked():
+        reset()
+        writer.render_template(iter(("<p>", "pong", "</p>")))
+    def send_json():
+        reset()
+        writer.send_json(PINS)
+    def send_json_large():
+        reset()
+        writer.send_json(SNAPSHOTS)
+    return [
+        bench_util.bench_alloc("render_template 'pong'", render_small, number = 500),
+        bench_util.bench_alloc("render_template chunked x3", render_chunked, number = 500),
+        bench_util.bench_alloc("send_json 16 pins", send_json, number = 500),
+        bench_util.bench_alloc("send_json 50 x 16 pins", send_json_large, number = 100),
+    ]
+
+#-------------------------------------------------------------------------------
+# config forms
+def make_tree(depth, breadth):
+    if depth == 0:
+        return OrderedDict((("leaf%d" % i, i) for i in range(breadth)))
+    return OrderedDict((("node%d" % i, make_tree(depth - 1, breadth)) for i in range(breadth)))
+
+def bench_forms():
+    results = []
+    for depth, breadth in ((2, 4), (4, 4)):
+        atf = AutoTreeFormat(make_tree(depth, breadth))
+        def gen_form():
+            for chunk in atf.gen_html_form():
+                pass
+        results.append(bench_util.bench_alloc("gen_html_form depth %d breadth %d" % (depth, breadth),
+                                              gen_form, number = 20))
+    return results
+
+#-------------------------------------------------------------------------------
+# url_tools
+def bench_url_tools():
+    qs = url_tools.urlencode([("section%d.name" % i, "sensor #%d / x" % i) for i in range(20)])
+    text = "sensor #12 / \"quoted\" & more"
+    return [
+        bench_util.bench_alloc("url_tools.parse_qs 20 fields", lambda: url_tools.parse_qs(qs), number = 200),
+        bench_util.bench_alloc("url_tools.quote", lambda: url_tools.quote(text), number = 500),
+    ]
+
+SUITES = OrderedDict((
+    ("parser",    bench_parser),
+    ("router",    bench_router),
+    ("templates", bench_templates),
+    ("writer",    bench_writer),
+    ("forms",     bench_forms),
+    ("url_tools", bench_url_tools),
+))
+
+def main():
+    output = sys.argv[1] if len(sys.argv) > 1 else None
+    all_results = OrderedDict()
+    for name, suite in SUITES.items():
+        print("-"*80)
+        print(name)
+        results = suite()
+        bench_util.report(results)
+        all_results[name] = results
+    if output:
+        with open(output, "w") as f:
+            f.write(json.dumps(all_results))
+        print("saved results to %s" % output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Benchmark decoding of large submitted config forms, comparing the old
+# eval-per-field decoder against the schema-typed `AutoTreeFormat.decode_form`
+import bench_util
+
+from pawpaw import AutoTreeFormat, url_tools
+from pawpaw.auto_tree_format import parse_form_url, _form_value
+
+def make_config(sections = 10, groups = 10, slots = 5):
+    tree = {}
+    for s in range(sections):
+        sect = tree["section%d" % s] = {}
+        for g in range(groups):
+            grp = sect["group%d" % g] = {}
+            grp["name"]    = "sensor %d.%d" % (s, g)
+            grp["enabled"] = (g % 2 == 0)
+            grp["rate"]    = 0.5 * g
+            grp["pin"]     = g
+            for i in range(slots - 4):
+                grp["slot%d" % i] = [i, i + 1]
+    return tree
+
+def legacy_parse_form_url(urlencoded_form):
+    #the eval based implementation that `parse_form_url` replaced
+    form_items = url_tools.parse_qsl(urlencoded_form)
+    d = {}
+    for path, value in form_items:
+        p = d
+        names = path.split(".")
+        for name in names[:-1]:
+            c = p.get(name,{})
+            p[name] = c
+            p = c
+        try:
+            value = eval(value,{"__builtins__":None},{})
+        except (NameError, TypeError, SyntaxError):
+            pass
+        p[names[-1]] = value
+    return d
+
+def main():
+    for shape in ((2, 5, 5), (10, 10, 5), (10, 20, 8)):
+        atf = AutoTreeFormat(make_config(*shape))
+        pairs = [(path, _form_value(leaf)) for path, leaf in atf.iter_leaves()]
+        form = url_tools.urlencode(pairs)
+        atf.get_schema() #built once per tree, not per request
+        number = max(1, 2000 // len(pairs))
+        print("-"*70)
+        print("config form: %d fields, %d bytes" % (len(pairs), len(form)))
+        results = [
+            bench_util.bench("legacy eval per field",
+                             lambda: legacy_parse_form_url(form), number = number),
+            bench_util.bench("parse_form_url (no schema)",
+                             lambda: parse_form_url(form), number = number),
+            bench_util.bench("AutoTreeFormat.decode_form (schema)",
+                             lambda: atf.decode_form(form), number = number),
+        ]
+        bench_util.report(results, baseline = "legacy eval per field")
+
+if __name__ == "__main__":
+    main()
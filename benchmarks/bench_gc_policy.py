@@ -0,0 +1,61 @@
+# Compare request latency and garbage collection pauses under each of the
+# `pawpaw.gc_policy` policies, using the built-in Metrics and HeapMonitor
+import bench_util
+
+from pawpaw import WebApp, Router, route
+from pawpaw.metrics import Metrics
+from pawpaw.sys_tools import ticks_us, ticks_diff
+from pawpaw.heap_monitor import HeapMonitor
+from pawpaw import gc_policy
+
+HOST = "127.0.0.1"
+PORT = 8781
+REQUESTS = 300
+
+@Router
+class BenchApp(WebApp):
+    @route(path="/state")
+    def state(self, context):
+        context.send_json({"pins": dict(("pin%d" % i, i % 2) for i in range(16))})
+
+POLICIES = (
+    ("CollectAlways",            lambda: gc_policy.CollectAlways()),
+    ("CollectEveryN(10)",        lambda: gc_policy.CollectEveryN(10)),
+    ("CollectBelowFree(16384)",  lambda: gc_policy.CollectBelowFree(16384, idle = True)),
+    ("CollectWhenIdle(50)",      lambda: gc_policy.CollectWhenIdle(50)),
+    ("GcThreshold(16384)",       lambda: gc_policy.GcThreshold(16384)),
+)
+
+def run(name, policy, port):
+    metrics = Metrics()
+    heap = HeapMonitor(start_tracing = False)
+    app = BenchApp(server_addr = HOST, server_port = port,
+                   socket_timeout = 0.05, log_dir = ".",
+                   monitors = [metrics, heap], gc_policy = policy)
+    stop = bench_util.start_app(app)
+    latencies = []
+    try:
+        for i in range(REQUESTS):
+            t0 = ticks_us()
+            bench_util.http_request(HOST, port, "/state")
+            latencies.append(ticks_diff(ticks_us(), t0))
+    finally:
+        stop()
+    latencies.sort()
+    gc_hist = heap.gc_pauses
+    print("%-26s p50 %7d us  p99 %7d us  server %6.0f us/req  gc %4d x %6.0f us" % (
+          name,
+          bench_util.percentile(latencies, 50),
+          bench_util.percentile(latencies, 99),
+          sum(h.total for h in metrics.phases.values()) / max(1, metrics.requests),
+          gc_hist.count,
+          gc_hist.total / max(1, gc_hist.count),
+          ))
+
+def main():
+    print("%d sequential GET requests per policy" % REQUESTS)
+    for i, (name, factory) in enumerate(POLICIES):
+        run(name, factory(), PORT + i)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# End-to-end benchmark of the request pipeline: starts benchmarks/bench_app.py
+# in a child process (any interpreter, e.g. the micropython unix port) and
+# drives each of its routes with the load generator.  Results are stored as
+# JSON so that runs can be compared across commits:
+#     python3 benchmarks/bench_server.py --save
+#     python3 benchmarks/bench_server.py --compare benchmarks/results/<old>.json
+import json, os, subprocess, sys, time
+
+import bench_util
+import loadgen
+from bench_app import ROUTES, DEFAULT_PORT
+
+RESULTS_DIR = os.path.join(bench_util._ROOT, "benchmarks", "results")
+
+def git_commit():
+    try:
+        out = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                      cwd = bench_util._ROOT, stderr = subprocess.DEVNULL)
+        return out.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def wait_for_server(host, port, path, timeout = 10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            status, nbytes = bench_util.http_request(host, port, path)
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError("server did not start serving on port %d" % port)
+
+def start_server(python, port, extra_env = None):
+    env = dict(os.environ)
+    if extra_env:
+        env.update(extra_env)
+    script = os.path.join(bench_util._ROOT, "benchmarks", "bench_app.py")
+    proc = subprocess.Popen([python, script, str(port)], cwd = bench_util._ROOT, env = env,
+                            stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    wait_for_server("127.0.0.1", port, ROUTES['exact_path'])
+    return proc
+
+def run_suite(python = sys.executable, port = DEFAULT_PORT, concurrency = 4,
+              requests = 400, warmup = 20, routes = None, extra_env = None):
+    proc = start_server(python, port, extra_env)
+    try:
+        results = {}
+        for name, path in ROUTES.items():
+            if routes and not name in routes:
+                continue
+            loadgen.run_load("127.0.0.1", port, path, 1, warmup)
+            results[name] = loadgen.run_load("127.0.0.1", port, path,
+                                             concurrency, requests)
+            print(loadgen.format_result(name, results[name]))
+    finally:
+        proc.kill()
+        proc.wait()
+    return {
+        'commit'     : git_commit(),
+        'timestamp'  : time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'server_python': python,
+        'concurrency': concurrency,
+        'requests'   : requests,
+        'results'    : results,
+    }
+
+def compare(old, new):
+    print("-"*70)
+    print("compared to %s (%s)" % (old['commit'], old['timestamp']))
+    for name, res in new['results'].items():
+        prev = old['results'].get(name)
+        if prev is None:
+            continue
+        print("%-12s req/s %+7.1f%%   p50 %+7.1f%%   p99 %+7.1f%%" % (
+              name,
+              100.0 * (res['req_per_s'] / prev['req_per_s'] - 1),
+              100.0 * (res['p50_ms'] / prev['p50_ms'] - 1),
+              100.0 * (res['p99_ms'] / prev['p99_ms'] - 1)))
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description = "pawpaw end-to-end benchmark")
+    parser.add_argument("--python", default = sys.executable,
+                        help = "interpreter that runs the server, e.g. micropython")
+    parser.add_argument("--port", type = int, default = DEFAULT_PORT)
+    parser.add_argument("-c", "--concurrency", type = int, default = 4)
+    parser.add_argument("-n", "--requests", type = int, default = 400)
+    parser.add_argument("--route", action = "append", choices = list(ROUTES.keys()),
+                        help = "only run the named route(s)")
+    parser.add_argument("--save", action = "store_true",
+                        help = "store the results in benchmarks/results/")
+    parser.add_argument("-o", "--output", help = "store the results in this file")
+    parser.add_argument("--compare", help = "a previous results file to compare against")
+    args = parser.parse_args()
+    run = run_suite(args.python, args.port, args.concurrency, args.requests,
+                    routes = args.route)
+    output = args.output
+    if args.save and output is None:
+        if not os.path.isdir(RESULTS_DIR):
+            os.makedirs(RESULTS_DIR)
+        output = os.path.join(RESULTS_DIR, "%s-%s.json" % (run['commit'],
+                              os.path.basename(args.python)))
+    if output:
+        with open(output, "w") as f:
+            json.dump(run, f, indent = 2, sort_keys = True)
+        print("saved results to %s" % output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), run)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# Startup cost of the package: time to import and heap held after import, each
+# sample taken in a fresh interpreter process, for CPython and, when found on
+# the PATH, the unix port of MicroPython:
+#     python3 benchmarks/bench_startup.py [--python micropython] [--path build/mpy]
+# --path puts a directory first on sys.path, e.g. the output of
+# tools/build_mpy.py to measure the precompiled bundle.
+import sys
+
+import bench_util
+
+try:
+    import json
+except ImportError:
+    import ujson as json #micropython specific
+
+STAGES = ('package', 'webapp', 'everything')
+
+def _import_stage(stage):
+    if stage == 'package':
+        import pawpaw
+    elif stage == 'webapp':
+        from pawpaw import WebApp
+    elif stage == 'everything':
+        from pawpaw import WebApp, Template, LazyTemplate, AutoTreeFormat, Middleware
+
+def child(stage):
+    #runs in the child process, prints one JSON result line
+    import gc
+    micropython = hasattr(gc, 'mem_alloc')
+    if micropython:
+        gc.collect()
+        a0 = gc.mem_alloc()
+    else:
+        import tracemalloc
+        tracemalloc.start()
+    t0 = bench_util.ticks_us()
+    _import_stage(stage)
+    dt = bench_util.ticks_diff(bench_util.ticks_us(), t0)
+    if micropython:
+        gc.collect()
+        heap = gc.mem_alloc() - a0
+    else:
+        heap = tracemalloc.get_traced_memory()[0]
+    print(json.dumps({'stage': stage, 'import_us': dt, 'heap_bytes': heap}))
+
+def run(python, stage, path = None, samples = 7):
+    #median of the samples, every one a fresh process
+    import subprocess
+    cmd = [python, __file__, "--child", stage]
+    if path:
+        cmd.append(path)
+    times = []
+    heaps = []
+    for i in range(samples):
+        out = subprocess.check_output(cmd, cwd = bench_util._ROOT)
+        res = json.loads(out.decode().strip().splitlines()[-1])
+        times.append(res['import_us'])
+        heaps.append(res['heap_bytes'])
+    return {
+        'import_us' : bench_util.percentile(sorted(times), 50),
+        'heap_bytes': bench_util.percentile(sorted(heaps), 50),
+    }
+
+def main():
+    import argparse, shutil
+    parser = argparse.ArgumentParser(description = "pawpaw startup benchmark")
+    parser.add_argument("--python", action = "append",
+                        help = "interpreter to measure, may be repeated")
+    parser.add_argument("--path", default = None,
+                        help = "directory put first on sys.path of the children")
+    parser.add_argument("-n", "--samples", type = int, default = 7)
+    args = parser.parse_args()
+    pythons = args.python
+    if not pythons:
+        pythons = [sys.executable]
+        if shutil.which("micropython"):
+            pythons.append("micropython")
+    for python in pythons:
+        print("-"*70)
+        print(python)
+        for stage in STAGES:
+            res = run(python, stage, path = args.path, samples = args.samples)
+            print("%-12s %10.0f us %10d B" % (stage, res['import_us'], res['heap_bytes']))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--child":
+        if len(sys.argv) > 3:
+            sys.path.insert(0, sys.argv[3])
+        child(sys.argv[2])
+    else:
+        main()
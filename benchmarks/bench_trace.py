@@ -0,0 +1,83 @@
+# Throughput of the request pipeline with tracing at the 'debug' level (the
+# old hard-coded DEBUG = True) versus disabled, the level is fixed at import
+# time so each level serves benchmarks/bench_app.py in its own child process:
+#     python3 benchmarks/bench_trace.py [--python micropython] [-r 9]
+# All the servers are started up front and the load runs take turns between
+# the levels, in a rotating order, round after round, so that drift of the
+# machine hits every level alike.  Each route reports the median req/s per
+# level over the rounds with its spread (min-max), and the median of the
+# per-round ratios of 'none' to 'debug'.
+import sys
+
+import bench_util
+import bench_server
+import loadgen
+from bench_app import ROUTES, DEFAULT_PORT
+
+LEVELS = ('debug', 'warning', 'none')
+
+def median(values):
+    values = sorted(values)
+    n = len(values)
+    if n % 2:
+        return values[n // 2]
+    return (values[n // 2 - 1] + values[n // 2]) / 2.0
+
+def run_rounds(ports, concurrency, requests, rounds, warmup = 20):
+    #returns {route name: {level: [req/s of each round]}}
+    rates = dict((name, dict((level, []) for level in LEVELS)) for name in ROUTES)
+    for level in LEVELS:
+        for path in ROUTES.values():
+            loadgen.run_load("127.0.0.1", ports[level], path, 1, warmup)
+    for r in range(rounds):
+        order = LEVELS[r % len(LEVELS):] + LEVELS[:r % len(LEVELS)]
+        for name, path in ROUTES.items():
+            for level in order:
+                res = loadgen.run_load("127.0.0.1", ports[level], path,
+                                       concurrency, requests)
+                if res['errors']:
+                    raise RuntimeError("%d errors on %s at level %s" %
+                                       (res['errors'], path, level))
+                rates[name][level].append(res['req_per_s'])
+        print("round %d/%d done" % (r + 1, rounds))
+    return rates
+
+def report(rates):
+    print("-"*70)
+    print("%-12s " % "req/s" + "".join("%-24s" % level for level in LEVELS))
+    for name, by_level in rates.items():
+        cells = ["%7.1f (%6.1f-%6.1f)" % (median(v), min(v), max(v))
+                 for v in (by_level[level] for level in LEVELS)]
+        print("%-12s " % name + " ".join(cells))
+    print("-"*70)
+    print("'none' over 'debug', median of the per-round ratios (min-max)")
+    for name, by_level in rates.items():
+        ratios = [100.0 * (n / d - 1) for n, d in zip(by_level['none'], by_level['debug'])]
+        print("%-12s %+7.1f%%  (%+6.1f%% to %+6.1f%%)" % (
+              name, median(ratios), min(ratios), max(ratios)))
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description = "pawpaw tracing overhead benchmark")
+    parser.add_argument("--python", default = sys.executable)
+    parser.add_argument("-c", "--concurrency", type = int, default = 4)
+    parser.add_argument("-n", "--requests", type = int, default = 1000,
+                        help = "requests per route, level and round")
+    parser.add_argument("-r", "--rounds", type = int, default = 7)
+    args = parser.parse_args()
+    ports = {}
+    procs = []
+    try:
+        for i, level in enumerate(LEVELS):
+            ports[level] = DEFAULT_PORT + i
+            procs.append(bench_server.start_server(args.python, ports[level],
+                                                   extra_env = {"PAWPAW_TRACE_LEVEL": level}))
+        rates = run_rounds(ports, args.concurrency, args.requests, args.rounds)
+    finally:
+        for proc in procs:
+            proc.kill()
+            proc.wait()
+    report(rates)
+
+if __name__ == "__main__":
+    main()
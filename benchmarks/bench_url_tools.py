@@ -0,0 +1,98 @@
+# Micro-benchmarks for the percent-decoding in `pawpaw.url_tools`, compared
+# against the previous split based decoder and (on CPython) `urllib.parse`
+import bench_util
+
+from pawpaw import url_tools
+
+try:
+    from urllib import parse as urllib_parse
+except ImportError: #micropython has no urllib.parse
+    urllib_parse = None
+
+#-------------------------------------------------------------------------------
+# the split based implementation that the table driven decoder replaced
+def _legacy_hextobyte(hexdigs):
+    return bytes([int(hexdigs.decode('utf-8'),16)])
+
+def legacy_unquote_to_bytes(string):
+    if not string:
+        string.split
+        return b''
+    if isinstance(string, str):
+        string = string.encode('utf-8')
+    bits = string.split(b'%')
+    if len(bits) == 1:
+        return string
+    res = [bits[0]]
+    append = res.append
+    for item in bits[1:]:
+        try:
+            append(_legacy_hextobyte(item[:2]))
+            append(item[2:])
+        except ValueError:
+            append(b'%')
+            append(item)
+    return b''.join(res)
+
+def legacy_unquote(string, encoding='utf-8', errors='replace'):
+    if '%' not in string:
+        string.split
+        return string
+    bits = url_tools._get_asciire().split(string)
+    res = [bits[0]]
+    append = res.append
+    for i in range(1, len(bits), 2):
+        append(legacy_unquote_to_bytes(bits[i]).decode(encoding, errors))
+        append(bits[i + 1])
+    return ''.join(res)
+
+def legacy_parse_qsl(qs):
+    #url_tools.parse_qsl with the replaced decoder swapped in
+    saved = url_tools.unquote
+    url_tools.unquote = legacy_unquote
+    try:
+        return url_tools.parse_qsl(qs)
+    finally:
+        url_tools.unquote = saved
+
+#-------------------------------------------------------------------------------
+FIXTURES = (
+    ("plain",        "pin_state_toggle_button_number_12"),
+    ("few escapes",  "wifi.ssid=my%20home%20network"),
+    ("all escaped",  "%E2%9C%93%20%C3%A9%C3%A8%20%2F%3F%26%3D" * 8),
+    ("config form",  url_tools.urlencode([("section%d.name" % i, "sensor #%d / \"%d\"" % (i, i))
+                                          for i in range(20)])),
+)
+
+NUMBER = 1000 #calls per timed run
+REPEAT = 15   #runs per function, taking turns, the best one is reported
+
+def bind(func, text):
+    return lambda: func(text)
+
+def compare(name, text, legacy_func):
+    #times the legacy and the url_tools versions of `name`, and the urllib.parse
+    #one where there is one, the ratios are to the legacy version
+    funcs = [("legacy " + name, legacy_func),
+             ("url_tools." + name, getattr(url_tools, name))]
+    if not urllib_parse is None:
+        funcs.append(("urllib.parse." + name, getattr(urllib_parse, name)))
+    #the decoders must agree before their speeds mean anything
+    expected = funcs[1][1](text)
+    for label, func in funcs:
+        assert func(text) == expected, label
+    results = bench_util.bench_group([(label, bind(func, text)) for label, func in funcs],
+                                     number = NUMBER, repeat = REPEAT)
+    bench_util.report(results, baseline = "legacy " + name)
+
+def main():
+    for label, text in FIXTURES:
+        print("-"*70)
+        print("%s: %d chars, %d escapes" % (label, len(text), text.count('%')))
+        compare("unquote", text, legacy_unquote)
+        compare("unquote_to_bytes", text, legacy_unquote_to_bytes)
+        if '=' in text:
+            compare("parse_qsl", text, legacy_parse_qsl)
+
+if __name__ == "__main__":
+    main()
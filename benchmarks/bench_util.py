@@ -0,0 +1,177 @@
+# Shared helpers for the pawpaw benchmark scripts, these run unchanged on
+# CPython and on the unix port of MicroPython.
+#
+# Run the scripts from the repository root, e.g.:
+#     python3 benchmarks/bench_form_decode.py
+#     micropython benchmarks/bench_form_decode.py
+import sys
+
+try:
+    import os
+    _ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+except AttributeError: #micropython has no os.path, assume the repo root
+    _ROOT = "."
+if not _ROOT in sys.path:
+    sys.path.insert(0, _ROOT)
+
+try:
+    from time import ticks_us, ticks_diff #micropython specific
+except ImportError:
+    from time import perf_counter
+    def ticks_us():
+        return int(perf_counter()*1000000)
+    def ticks_diff(end, start):
+        return end - start
+
+def bench(name, func, number = 100, repeat = 5):
+    #returns the best of `repeat` runs of `number` calls each
+    best = None
+    for r in range(repeat):
+        t0 = ticks_us()
+        for i in range(number):
+            func()
+        dt = ticks_diff(ticks_us(), t0)
+        if best is None or dt < best:
+            best = dt
+    return {
+        'name'       : name,
+        'number'     : number,
+        'best_us'    : best,
+        'per_call_us': best / number,
+    }
+
+def bench_group(funcs, number = 100, repeat = 5):
+    #`bench` for a list of (name, func), with the runs of the functions taking
+    #turns so that a slow spell of the machine hits all of them alike
+    best = [None]*len(funcs)
+    for r in range(repeat):
+        for k, (name, func) in enumerate(funcs):
+            t0 = ticks_us()
+            for i in range(number):
+                func()
+            dt = ticks_diff(ticks_us(), t0)
+            if best[k] is None or dt < best[k]:
+                best[k] = dt
+    return [{
+        'name'       : name,
+        'number'     : number,
+        'best_us'    : best[k],
+        'per_call_us': best[k] / number,
+    } for k, (name, func) in enumerate(funcs)]
+
+def measure_alloc(func, number = 10):
+    #heap bytes allocated per call: on micropython the gross allocation with
+    #the collector paused, on CPython the peak traced by tracemalloc
+    import gc
+    if hasattr(gc, 'mem_alloc'): #micropython specific
+        gc.collect()
+        gc.disable()
+        try:
+            a0 = gc.mem_alloc()
+            for i in range(number):
+                func()
+            return (gc.mem_alloc() - a0) // number
+        finally:
+            gc.enable()
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        peak = 0
+        for i in range(number):
+            tracemalloc.reset_peak()
+            a0 = tracemalloc.get_traced_memory()[0]
+            func()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - a0)
+        return peak
+    finally:
+        tracemalloc.stop()
+
+def bench_alloc(name, func, number = 100, repeat = 5):
+    #`bench` plus the heap allocation per call
+    res = bench(name, func, number = number, repeat = repeat)
+    res['alloc_bytes'] = measure_alloc(func, number = min(number, 10))
+    return res
+
+def report(results, baseline = None):
+    #print a table, optionally with the speedup relative to the named result
+    base = None
+    for res in results:
+        if res['name'] == baseline:
+            base = res['per_call_us']
+    for res in results:
+        line = "%-40s %12.2f us/call" % (res['name'], res['per_call_us'])
+        if 'alloc_bytes' in res:
+            line += " %9d B/call" % res['alloc_bytes']
+        if base:
+            line += "   x%.2f" % (base / res['per_call_us'])
+        print(line)
+
+def percentile(sorted_values, p):
+    #nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    k = int(round(p / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[k]
+
+#-------------------------------------------------------------------------------
+# helpers for benchmarking a live WebApp over localhost sockets
+def start_app(app):
+    #serves the app on a background thread, returns a function that stops it,
+    #the app needs a socket_timeout so that the serving loop can notice
+    try:
+        import _thread
+    except ImportError:
+        import thread as _thread
+    state = {'running': True}
+    def serve():
+        while state['running']:
+            app.serve_once()
+        app._server.socket.close()
+        state['stopped'] = True
+    def stop():
+        state['running'] = False
+        while not 'stopped' in state:
+            sleep_ms(10)
+    _thread.start_new_thread(serve, ())
+    return stop
+
+def sleep_ms(ms):
+    try:
+        from time import sleep_ms as _sleep_ms #micropython specific
+        _sleep_ms(ms)
+    except ImportError:
+        from time import sleep
+        sleep(ms / 1000.0)
+
+def http_request(host, port, path, method = "GET", body = None, headers = None):
+    #one request per connection, as the server closes it after each response,
+    #returns (status_code, total_bytes_received)
+    import socket
+    addr = socket.getaddrinfo(host, port)[0][-1]
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.connect(addr)
+        lines = ["%s %s HTTP/1.1" % (method, path), "Host: %s" % host]
+        if headers:
+            for key, val in headers.items():
+                lines.append("%s: %s" % (key, val))
+        if body is not None:
+            lines.append("Content-Length: %d" % len(body))
+        req = "\r\n".join(lines) + "\r\n\r\n"
+        if body is not None:
+            req += body
+        sock.send(req.encode())
+        chunks = []
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                break
+            chunks.append(data)
+    finally:
+        sock.close()
+    resp = b"".join(chunks)
+    try:
+        status = int(resp.split(b" ", 2)[1])
+    except (IndexError, ValueError):
+        status = 0
+    return status, len(resp)
@@ -0,0 +1,96 @@
+# Concurrent HTTP load generator for benchmarking a pawpaw server, on the
+# same host or on a device, e.g.:
+#     python3 benchmarks/loadgen.py 192.168.4.1 80 /pins -c 4 -n 200
+import socket, threading, time, sys
+
+import bench_util
+
+def _worker(host, port, path, count, deadline, out):
+    latencies = []
+    nbytes = 0
+    errors = 0
+    addr = socket.getaddrinfo(host, port)[0][-1]
+    req = ("GET %s HTTP/1.1\r\nHost: %s\r\n\r\n" % (path, host)).encode()
+    n = 0
+    while (count is None or n < count) and (deadline is None or time.time() < deadline):
+        n += 1
+        t0 = time.perf_counter()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.connect(addr)
+            sock.sendall(req)
+            received = 0
+            head = b""
+            while True:
+                data = sock.recv(8192)
+                if not data:
+                    break
+                if not head:
+                    head = data[:12]
+                received += len(data)
+        except OSError:
+            errors += 1
+            continue
+        finally:
+            sock.close()
+        if not head.startswith(b"HTTP/1.1 2"):
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - t0)
+        nbytes += received
+    out.append((latencies, nbytes, errors))
+
+def run_load(host, port, path, concurrency = 4, requests = 200, duration = None):
+    #each of `concurrency` clients loops on fresh connections, either for a
+    #total of `requests` requests or for `duration` seconds
+    count = None
+    if duration is None:
+        count = max(1, requests // concurrency)
+    deadline = None if duration is None else time.time() + duration
+    out = []
+    threads = [threading.Thread(target = _worker, args = (host, port, path, count, deadline, out))
+               for i in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    latencies = sorted(l for lats, b, e in out for l in lats)
+    nbytes = sum(b for lats, b, e in out)
+    errors = sum(e for lats, b, e in out)
+    ms = lambda s: None if s is None else round(s * 1000, 3)
+    return {
+        'path'       : path,
+        'concurrency': concurrency,
+        'requests'   : len(latencies),
+        'errors'     : errors,
+        'elapsed_s'  : round(elapsed, 3),
+        'req_per_s'  : round(len(latencies) / elapsed, 1),
+        'bytes_per_s': round(nbytes / elapsed, 1),
+        'p50_ms'     : ms(bench_util.percentile(latencies, 50)),
+        'p99_ms'     : ms(bench_util.percentile(latencies, 99)),
+    }
+
+def format_result(name, res):
+    return "%-12s %8.1f req/s  p50 %8.3f ms  p99 %8.3f ms  %10.0f B/s  errors %d" % (
+        name, res['req_per_s'], res['p50_ms'] or 0, res['p99_ms'] or 0,
+        res['bytes_per_s'], res['errors'])
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description = "HTTP load generator")
+    parser.add_argument("host")
+    parser.add_argument("port", type = int)
+    parser.add_argument("path")
+    parser.add_argument("-c", "--concurrency", type = int, default = 4)
+    parser.add_argument("-n", "--requests", type = int, default = 200)
+    parser.add_argument("-d", "--duration", type = float, default = None,
+                        help = "run for this many seconds instead of a fixed count")
+    args = parser.parse_args()
+    res = run_load(args.host, args.port, args.path, args.concurrency,
+                   args.requests, args.duration)
+    print(format_result(args.path, res))
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,23 @@
-from .web_app import WebApp, Router, route
-from .template_engine import Template, LazyTemplate
-from .auto_tree_format import AutoTreeFormat
+# The public names are imported on first use (module __getattr__, PEP 562, also
+# in micropython), so `import pawpaw` is cheap and an app only pays the boot
+# time and heap of the modules it actually touches.
+_LAZY_NAMES = {
+    'WebApp'        : 'web_app',
+    'Router'        : 'web_app',
+    'route'         : 'web_app',
+    'Template'      : 'template_engine',
+    'LazyTemplate'  : 'template_engine',
+    'AutoTreeFormat': 'auto_tree_format',
+    'Middleware'    : 'middleware',
+}
+
+__all__ = tuple(_LAZY_NAMES.keys())
+
+def __getattr__(name):
+    modname = _LAZY_NAMES.get(name)
+    if modname is None:
+        raise AttributeError("module 'pawpaw' has no attribute '%s'" % name)
+    module = __import__("pawpaw." + modname, None, None, [name])
+    value = getattr(module, name)
+    globals()[name] = value #later lookups no longer get here
+    return value
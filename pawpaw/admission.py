@@ -0,0 +1,47 @@
+from .sys_tools import mem_free
+
+# Admission control, HttpServer asks `admit` once the headers of a request tell
+# its route, before the body is read.  Requests are shed, with a pre-encoded
+# 503 and a Retry-After header, when the free heap or the number of connections
+# held open (websockets and event streams) leaves too little room for their
+# route's priority.  Routes declare it with `@route(..., priority=...)`, high
+# priority routes, e.g. control endpoints, are always admitted.
+
+PRIORITY_LOW    = 0
+PRIORITY_NORMAL = 1
+PRIORITY_HIGH   = 2
+
+################################################################################
+# Classes
+class AdmissionControl(object):
+    def __init__(self,
+                 min_free_low    = 16384, #bytes of free heap needed to admit
+                 min_free_normal = 8192,
+                 max_inflight_low    = 2, #open connections, None for no limit
+                 max_inflight_normal = None,
+                 retry_after = 5, #seconds, suggested to the shed clients
+                 ):
+        self.min_free     = (min_free_low, min_free_normal)
+        self.max_inflight = (max_inflight_low, max_inflight_normal)
+        self.retry_after  = retry_after
+        self.shed = 0
+
+    def admit(self, server, priority):
+        if priority >= PRIORITY_HIGH:
+            return True
+        priority = max(priority, PRIORITY_LOW)
+        max_inflight = self.max_inflight[priority]
+        if not max_inflight is None:
+            inflight = len(server.websockets) + len(server.event_streams)
+            if inflight >= max_inflight:
+                self.shed += 1
+                return False
+        min_free = self.min_free[priority]
+        free = mem_free()
+        if not free is None and free < min_free:
+            #garbage may be all that stands in the way
+            server.collect_garbage()
+            if mem_free() < min_free:
+                self.shed += 1
+                return False
+        return True
@@ -3,11 +3,31 @@ try:
 except ImportError:
     import ujson as json #micropython specific
     
-#from . import urllib_parse
+try:
+    import os
+except ImportError:
+    import uos as os #micropython specific
+    
+from . import url_tools
+from . import json_stream
+
+class _StreamedBranch(object):
+    #stands in for an inner (dict) node whose contents are still in the stream,
+    #node functions only ever test for the "items" attribute
+    def items(self):
+        return ()
+
+_STREAMED_BRANCH = _StreamedBranch()
+_ROOT_NODE = object() #marks a walk from the root, None is a valid leaf
 
 class AutoTreeFormat(object):
-    def __init__(self, tree):
+    def __init__(self, tree, json_filename = None):
+        #when tree is None the nodes are streamed from json_filename on every
+        #walk so the full tree never needs to be in memory
         self._tree = tree
+        self._json_filename = json_filename
+        self._schema = None
+        self._dirty  = False #set when leaves have been patched since last save
         
     def gen_yaml(self, indent_step=2):
         buff = []
@@ -34,6 +54,8 @@ class AutoTreeFormat(object):
             #buff is updated through side-effects in the node functions
             yield "".join(buff)
             buff = []
+        if buff: #after_node_func output following the last node
+            yield "".join(buff)
         
     def gen_html_form(self, indent_step=2):
         buff = []
@@ -61,7 +83,7 @@ class AutoTreeFormat(object):
                 self._node_path.pop()
             return
         def lnode_func(ln):
-            buff.append('value="%s"></div>\n' % (ln,))
+            buff.append('value="%s"></div>\n' % (_html_escape(_form_value(ln)),))
             return (ln,)
 
         for node in self._recur_walk(inner_node_func = inode_func,
@@ -71,14 +93,135 @@ class AutoTreeFormat(object):
             #buff is updated through side-effects in the node functions
             yield "".join(buff)
             buff = []
+        if buff: #after_node_func output following the last node
+            yield "".join(buff)
+        
+    def iter_leaves(self):
+        #yields (dotted_path, leaf) pairs using the same path naming as the
+        #input names of `gen_html_form`
+        node_path = []
+        leaf = []
+        def inode_func(k, sn):
+            node_path.append(k)
+            return (k,sn)
+        def anode_func(k, sn):
+            node_path.pop()
+            return
+        def lnode_func(ln):
+            leaf.append(ln)
+            return (ln,)
+        for node in self._recur_walk(inner_node_func = inode_func,
+                                     after_node_func = anode_func,
+                                     leaf_node_func  = lnode_func,
+                                    ):
+            #the leaf is captured through side-effects in lnode_func
+            if leaf:
+                yield (".".join(node_path), leaf.pop())
+                
+    def get_schema(self):
+        #maps each dotted leaf path to the type of its current value, built
+        #once per instance (in streaming mode this walks the file once)
+        if self._schema is None:
+            schema = {}
+            for path, leaf in self.iter_leaves():
+                schema[path] = type(leaf)
+            self._schema = schema
+        return self._schema
+        
+    def decode_form(self, urlencoded_form):
+        #decode a submitted `gen_html_form` form into a nested dict, coercing
+        #each field to the type of the leaf at the same path in this tree
+        return parse_form_url(urlencoded_form, schema = self.get_schema())
+        
+    def diff(self, new_tree):
+        #returns {dotted_path: new_value} for the leaves of new_tree that differ
+        #from this tree, leaves missing from new_tree count as unchanged
+        new_leaves = flatten_tree(new_tree)
+        changes = {}
+        for path, leaf in self.iter_leaves():
+            if not path in new_leaves:
+                continue
+            new_leaf = new_leaves.pop(path)
+            if type(new_leaf) != type(leaf) or new_leaf != leaf:
+                changes[path] = new_leaf
+        #whatever remains are leaves that are new to this tree
+        changes.update(new_leaves)
+        return changes
+        
+    def patch(self, changes):
+        #applies only the changed leaves from `diff`, returns the change count
+        if not changes:
+            return 0
+        tree = self.get_tree()
+        schema = self._schema
+        for path, value in changes.items():
+            p = tree
+            names = path.split(".")
+            for name in names[:-1]:
+                c = p.get(name)
+                if not hasattr(c,"items"):
+                    p[name] = c = {}
+                p = c
+            p[names[-1]] = value
+            if not schema is None:
+                schema[path] = type(value)
+        self._dirty = True
+        return len(changes)
+        
+    def update_from_form(self, urlencoded_form):
+        #decode, diff and patch a submitted `gen_html_form`, returning changes
+        changes = self.diff(self.decode_form(urlencoded_form))
+        self.patch(changes)
+        return changes
+        
+    def get_tree(self):
+        #loads the tree if in streaming mode, after this walks use memory
+        if self._tree is None:
+            with _open_json_file(self._json_filename) as f:
+                self._tree = json_stream.load(f)
+        return self._tree
+        
+    def save_json_file(self, filename = None, force = False):
+        #skips the write (and the flash wear) unless leaves have been patched,
+        #returns True when the file was written
+        if not (self._dirty or force):
+            return False
+        if filename is None:
+            filename = self._json_filename
+        if filename is None:
+            raise ValueError("no filename to save the tree to")
+        tree = self.get_tree()
+        #write beside the target then swap it in, so a reset mid-write can't
+        #leave a truncated config behind
+        tmp_filename = filename + ".tmp"
+        with open(tmp_filename,'w') as f:
+            f.write(json.dumps(tree))
+        try:
+            os.rename(tmp_filename, filename)
+        except OSError:
+            #FAT won't rename over an existing file, a reset from here on
+            #leaves only the complete .tmp, which the loaders fall back to
+            os.remove(filename)
+            os.rename(tmp_filename, filename)
+        self._json_filename = filename
+        self._dirty = False
+        return True
         
     def _recur_walk(self,
-                    node = None,
+                    node = _ROOT_NODE,
                     inner_node_func = lambda k,sn: (k,sn),
                     after_node_func = lambda k,sn: (),
                     leaf_node_func  = lambda ln: (ln,),
                     ):
-        if node is None:
+        if node is _ROOT_NODE:
+            if self._tree is None: #streaming mode
+                gen_nodes = self._stream_walk(inner_node_func = inner_node_func,
+                                              after_node_func = after_node_func,
+                                              leaf_node_func  = leaf_node_func,
+                                             )
+                for n in gen_nodes:
+                    yield n
+                return
             node = self._tree
         if hasattr(node,"items"):
             for key, subnode in node.items():
@@ -87,6 +230,7 @@ class AutoTreeFormat(object):
                 #recur over sub-nodes
                 gen_nodes = self._recur_walk(node=subnode,
                                              inner_node_func=inner_node_func,
+                                             after_node_func=after_node_func,
                                              leaf_node_func=leaf_node_func,
                                             )
                 for n in gen_nodes:
@@ -95,31 +239,149 @@ class AutoTreeFormat(object):
         else: #is a leaf node
             #wrap in a 1-tuple
             yield leaf_node_func(node)
+            
+    def _stream_walk(self,
+                     inner_node_func,
+                     after_node_func,
+                     leaf_node_func,
+                    ):
+        #same node function protocol as `_recur_walk` but driven directly by
+        #the JSON parse events, only arrays are materialized (as leaves)
+        with _open_json_file(self._json_filename) as f:
+            events = json_stream.iter_events(f)
+            ev, val = next(events)
+            if ev != json_stream.START_MAP: #the whole document is a leaf
+                yield leaf_node_func(json_stream.build_value(ev, val, events))
+                return
+            keys = [] #keys of the currently open inner nodes
+            for ev, val in events:
+                if ev == json_stream.KEY:
+                    key = val
+                    ev, val = next(events)
+                    if ev == json_stream.START_MAP:
+                        yield inner_node_func(key, _STREAMED_BRANCH)
+                        keys.append(key)
+                    else:
+                        leaf = json_stream.build_value(ev, val, events)
+                        yield inner_node_func(key, leaf)
+                        yield leaf_node_func(leaf)
+                        after_node_func(key, leaf)
+                elif ev == json_stream.END_MAP and keys:
+                    after_node_func(keys.pop(), _STREAMED_BRANCH)
     
     @classmethod
-    def from_json_file(cls, filename):
-        f = open(filename,'r')
-        d = json.loads(f.read())
-        return cls(tree=d)
+    def from_json_file(cls, filename, stream = False):
+        if stream:
+            #defer all parsing until the tree is walked
+            return cls(tree=None, json_filename=filename)
+        with _open_json_file(filename) as f:
+            d = json.loads(f.read())
+        return cls(tree=d, json_filename=filename)
         
-def parse_form_url(urlencoded_form):
-    form_items = urllib_parse.parse_qsl(urlencoded_form)
+def _open_json_file(filename):
+    #a save interrupted between removing the file and renaming its
+    #replacement in leaves only the replacement, see `save_json_file`
+    try:
+        return open(filename,'r')
+    except OSError as exc:
+        error = exc
+    try:
+        return open(filename + ".tmp",'r')
+    except OSError:
+        raise error #the file itself is missing
+        
+################################################################################
+# Form Decoding
+#-------------------------------------------------------------------------------
+def flatten_tree(tree, prefix = ""):
+    #returns {dotted_path: leaf} for a nested dict
+    leaves = {}
+    for key, subnode in tree.items():
+        path = prefix + key
+        if hasattr(subnode,"items"):
+            leaves.update(flatten_tree(subnode, prefix = path + "."))
+        else:
+            leaves[path] = subnode
+    return leaves
+
+_TRUE_WORDS  = ("True", "true", "on", "1")
+_FALSE_WORDS = ("False", "false", "off", "0", "")
+_NONE_WORDS  = ("None", "null", "")
+
+def _html_escape(text):
+    return text.replace("&","&amp;").replace('"',"&quot;").replace("<","&lt;")
+
+def _form_value(leaf):
+    #arrays are written as JSON so that they can be decoded again
+    if isinstance(leaf, (list, tuple)):
+        return json.dumps(leaf)
+    return str(leaf)
+
+def _decode_bool(value):
+    if value in _TRUE_WORDS:
+        return True
+    if value in _FALSE_WORDS:
+        return False
+    raise ValueError("not a boolean '%s'" % value)
+
+def _decode_none(value):
+    if value in _NONE_WORDS:
+        return None
+    return _guess_type(value)
+
+def _decode_json(value):
+    return json.loads(value)
+
+_DECODERS = {
+    bool : _decode_bool,
+    int  : int,
+    float: float,
+    str  : str,
+    list : _decode_json,
+    dict : _decode_json,
+    type(None): _decode_none,
+}
+
+def _guess_type(value):
+    #fallback for fields which have no schema entry, replaces the old eval
+    if value in ("True", "False"):
+        return value == "True"
+    if value == "None":
+        return None
+    for decoder in (int, float):
+        try:
+            return decoder(value)
+        except ValueError:
+            pass
+    return value
+
+def parse_form_url(urlencoded_form, schema = None):
+    #schema maps dotted paths to leaf types, see `AutoTreeFormat.get_schema`
+    if schema is None:
+        schema = {}
+    form_items = url_tools.parse_qsl(urlencoded_form, keep_blank_values = True)
     d = {}
     for path, value in form_items:
         p = d
         names = path.split(".")
-        for name in names[:-1]:
-            c = p.get(name,{})
-            p[name] = c
+        for i, name in enumerate(names[:-1]):
+            c = p.get(name)
+            if c is None and not name in p:
+                p[name] = c = {}
+            elif not hasattr(c,"items"): #an earlier field made it a leaf
+                raise ValueError("form field '%s' conflicts with field '%s'" % (path, ".".join(names[:i+1])))
             p = c
-        try:
-            #convert string into a python type, safely
-            value = eval(value,{"__builtins__":None},{})
-        except NameError:
-            pass
-        except TypeError:
-            pass
-        #otherwise keep as string
+        if hasattr(p.get(names[-1]),"items"):
+            raise ValueError("form field '%s' conflicts with the fields under it" % (path,))
+        leaf_type = schema.get(path)
+        if leaf_type is None:
+            value = _guess_type(value)
+        else:
+            decoder = _DECODERS.get(leaf_type, str)
+            try:
+                value = decoder(value)
+            except ValueError:
+                raise ValueError("form field '%s' got bad value for %s: '%s'" % (path, leaf_type.__name__, value))
         p[names[-1]] = value
     return d
     
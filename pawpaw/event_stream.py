@@ -0,0 +1,108 @@
+from .sys_tools import ticks_ms, ticks_diff
+from .http_connection_writer import frame_chunk, LAST_CHUNK
+
+# Server-Sent Events (text/event-stream) responses, started by
+# `HttpConnectionWriter.send_event_stream(events)`.  The response stays open
+# and HttpServer advances the `events` iterator one item per polling cycle,
+# alongside the other connections, so a stream never blocks the server.  Each
+# item is one of:
+#     None                   nothing new, lets the heartbeat go out if due
+#     data                   a str sent as the data of an unnamed event
+#     (event, data)          a named event, event may be None
+#     (event, data, id)      also sets the id the client reconnects with
+# A client reconnecting sends the last id it saw, see `last_event_id`.
+
+CONTENT_TYPE      = 'text/event-stream'
+DEFAULT_HEARTBEAT = 15 #seconds of silence before a comment line is sent
+WRITE_TIMEOUT     = 5  #seconds, a client that stops reading is dropped
+
+_HEARTBEAT = b":\n\n"
+
+def format_event(item):
+    if isinstance(item, str):
+        event, data, id_ = None, item, None
+    elif len(item) == 2:
+        event, data = item
+        id_ = None
+    else:
+        event, data, id_ = item
+    buff = []
+    if not event is None:
+        buff.append("event: %s\n" % event)
+    if not id_ is None:
+        buff.append("id: %s\n" % id_)
+    for line in str(data).split("\n"): #one data field per line
+        buff.append("data: %s\n" % line)
+    buff.append("\n")
+    return "".join(buff)
+
+def last_event_id(request):
+    #the id of the last event a reconnecting client received, or None
+    val = request.headers.get('Last-Event-ID')
+    if val is None:
+        return None
+    return val.strip()
+
+################################################################################
+# Classes
+class EventStream(object):
+    def __init__(self, request, events, heartbeat = DEFAULT_HEARTBEAT):
+        self.request = request
+        self.sock    = None
+        self.closed  = False
+        self._events = iter(events)
+        self._io     = None
+        self._heartbeat_ms = None
+        if heartbeat:
+            self._heartbeat_ms = int(heartbeat*1000)
+        self._last_write = ticks_ms()
+
+    def open(self, sock):
+        #called by HttpServer once the response headers are sent
+        self.sock = sock
+        sock.settimeout(WRITE_TIMEOUT)
+        #on micropython makefile returns the socket itself
+        self._io = sock.makefile('wb', 0)
+
+    def step(self):
+        #sends the next event, if there is one, returns False once finished
+        try:
+            item = next(self._events)
+        except StopIteration:
+            self.finish()
+            return False
+        if item is None:
+            hb = self._heartbeat_ms
+            if not hb is None and ticks_diff(ticks_ms(), self._last_write) >= hb:
+                self._write(frame_chunk(_HEARTBEAT))
+            return True
+        self._write(frame_chunk(format_event(item)))
+        return True
+
+    def finish(self):
+        #ends the response properly, the client may reconnect later
+        if self.closed:
+            return
+        try:
+            self._write(LAST_CHUNK)
+        except OSError:
+            pass
+        self.abort()
+
+    def abort(self):
+        if self.closed:
+            return
+        self.closed = True
+        if not self._io is None and not self._io is self.sock:
+            self._io.close()
+        self.sock.close()
+
+    def _write(self, data):
+        mv = memoryview(data)
+        pos = 0
+        while pos < len(data):
+            count = self._io.write(mv[pos:])
+            if count is None: #would block
+                count = 0
+            pos += count
+        self._last_write = ticks_ms()
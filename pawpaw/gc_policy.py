@@ -0,0 +1,92 @@
+import gc
+
+from .sys_tools import mem_free
+
+# Policies deciding when HttpServer runs `gc.collect()`.  The server asks
+# `after_request` once every handled request and `on_idle` once every accept
+# that timed out without a connection (only with a socket_timeout), so idle
+# collections cost nothing while clients are waiting.
+
+################################################################################
+# Classes
+class GcPolicy(object):
+    def __init__(self, idle = False):
+        self.idle = idle   #collect on idle cycles if requests are pending
+        self.pending = 0   #requests handled since the last collection
+
+    def install(self):
+        #called once when the server is created
+        pass
+
+    def should_collect(self):
+        #override, decides after each request
+        return False
+
+    def after_request(self):
+        self.pending += 1
+        if self.should_collect():
+            self.pending = 0
+            return True
+        return False
+
+    def on_idle(self):
+        if self.idle and self.pending:
+            self.pending = 0
+            return True
+        return False
+
+#-------------------------------------------------------------------------------
+# CollectAlways - the original behavior, a full collection after every request
+#                 and every timed out accept
+class CollectAlways(GcPolicy):
+    def should_collect(self):
+        return True
+
+    def on_idle(self):
+        return True
+
+#-------------------------------------------------------------------------------
+class CollectEveryN(GcPolicy):
+    def __init__(self, n, idle = False):
+        GcPolicy.__init__(self, idle = idle)
+        self.n = n
+
+    def should_collect(self):
+        return self.pending >= self.n
+
+#-------------------------------------------------------------------------------
+# CollectBelowFree - collect only once the free heap drops under min_free bytes,
+#                    on CPython (no gc.mem_free) it never forces a collection
+class CollectBelowFree(GcPolicy):
+    def __init__(self, min_free, idle = False):
+        GcPolicy.__init__(self, idle = idle)
+        self.min_free = min_free
+
+    def should_collect(self):
+        free = mem_free()
+        return not free is None and free < self.min_free
+
+#-------------------------------------------------------------------------------
+# CollectWhenIdle - defer all collections to idle cycles, but never let more
+#                   than max_pending requests go by without one
+class CollectWhenIdle(GcPolicy):
+    def __init__(self, max_pending = 20):
+        GcPolicy.__init__(self, idle = True)
+        self.max_pending = max_pending
+
+    def should_collect(self):
+        return self.pending >= self.max_pending
+
+#-------------------------------------------------------------------------------
+# GcThreshold - hand the decision to the micropython allocator, which collects
+#               on its own after `allocation` bytes, see `gc.threshold`
+class GcThreshold(GcPolicy):
+    def __init__(self, allocation, idle = False):
+        GcPolicy.__init__(self, idle = idle)
+        self.allocation = allocation
+
+    def install(self):
+        try:
+            gc.threshold(self.allocation) #micropython specific
+        except AttributeError:
+            pass #CPython has its own generational thresholds
@@ -0,0 +1,143 @@
+import gc
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ucollections import OrderedDict #micropython specific
+
+from .metrics import RequestMonitor, Histogram, _format_histogram, _escape_label
+from .sys_tools import ticks_us, ticks_diff, mem_free
+
+#buckets for the garbage collection pause histogram in microseconds
+GC_BUCKETS_US = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000)
+
+#-------------------------------------------------------------------------------
+# heap probes - on micropython the gc module reports the heap directly, on
+# CPython tracemalloc traces the allocations (free heap is unbounded, so
+# sys_tools.mem_free gives None)
+try:
+    _mem_alloc = gc.mem_alloc  #micropython specific
+    _reset_peak = None
+    _get_peak   = None
+    HEAP_SOURCE = 'gc'
+except AttributeError:
+    import tracemalloc
+    def _mem_alloc():
+        return tracemalloc.get_traced_memory()[0]
+    def _get_peak():
+        return tracemalloc.get_traced_memory()[1]
+    _reset_peak = getattr(tracemalloc, 'reset_peak', None) #new in CPython 3.9
+    HEAP_SOURCE = 'tracemalloc'
+
+################################################################################
+# Classes
+class HeapStats(object):
+    __slots__ = 'count','alloc_total','alloc_max','free_min','retained_max'
+    def __init__(self):
+        self.count = 0
+        self.alloc_total = 0   #sum of net bytes allocated, for the mean
+        self.alloc_max   = 0   #worst case net bytes allocated
+        self.free_min    = None #lowest free heap seen, None if unknown
+        self.retained_max = 0  #worst bytes still held after the next collection
+
+    def add(self, alloc, free):
+        self.count += 1
+        self.alloc_total += alloc
+        if alloc > self.alloc_max:
+            self.alloc_max = alloc
+        if not free is None and (self.free_min is None or free < self.free_min):
+            self.free_min = free
+
+#-------------------------------------------------------------------------------
+# HeapMonitor - records the heap before and after each request phase, the peak
+#               allocation per route, the heap retained by each route after
+#               garbage collection (leaks and fragmentation show up here) and
+#               the duration of every collection
+class HeapMonitor(RequestMonitor):
+    def __init__(self, start_tracing = True):
+        if HEAP_SOURCE == 'tracemalloc' and start_tracing and not tracemalloc.is_tracing():
+            #NOTE tracing slows CPython down noticeably, leave it off in production
+            tracemalloc.start()
+        self.phases = OrderedDict()
+        self.routes = OrderedDict()
+        self.gc_pauses = Histogram(GC_BUCKETS_US)
+        self._phase = None
+        self._phase_alloc   = 0
+        self._request_alloc = 0
+        self._request_peak  = 0
+        self._last_route = None
+        self._gc_start = 0
+
+    def _stats(self, registry, key):
+        stats = registry.get(key)
+        if stats is None:
+            registry[key] = stats = HeapStats()
+        return stats
+
+    def _end_phase(self):
+        alloc = _mem_alloc()
+        delta = alloc - self._phase_alloc
+        self._stats(self.phases, self._phase).add(delta, mem_free())
+        used = alloc - self._request_alloc
+        if used > self._request_peak:
+            self._request_peak = used
+        return alloc
+
+    def request_begin(self):
+        if not _reset_peak is None:
+            _reset_peak()
+        self._request_alloc = self._phase_alloc = _mem_alloc()
+        self._request_peak = 0
+        self._phase = 'accept'
+        self._last_route = None
+
+    def phase_begin(self, phase):
+        self._phase_alloc = self._end_phase()
+        self._phase = phase
+
+    def request_end(self, route):
+        self._end_phase()
+        peak = self._request_peak
+        if not _get_peak is None: #exact peak over the whole request
+            peak = _get_peak() - self._request_alloc
+        if not route is None:
+            self._stats(self.routes, route).add(peak, mem_free())
+        self._last_route = route
+
+    def gc_begin(self):
+        self._gc_start = ticks_us()
+
+    def gc_end(self):
+        self.gc_pauses.observe(ticks_diff(ticks_us(), self._gc_start))
+        #what the last request left behind after the collection
+        route = self._last_route
+        if not route is None:
+            retained = _mem_alloc() - self._request_alloc
+            stats = self.routes[route]
+            if retained > stats.retained_max:
+                stats.retained_max = retained
+            self._last_route = None
+
+    def gen_report(self):
+        #yields a YAML document, suitable for writing to a log entry
+        yield "HeapSource: %s\n" % HEAP_SOURCE
+        yield "GC:\n    count: %d\n    total_us: %d\n" % (self.gc_pauses.count, self.gc_pauses.total)
+        for title, registry in (("Phases", self.phases), ("Routes", self.routes)):
+            yield "%s:\n" % title
+            for key, stats in registry.items():
+                yield "    %r:\n" % (key,)
+                for attr in stats.__slots__:
+                    yield "        %s: %s\n" % (attr, getattr(stats, attr))
+
+    def gen_prometheus(self):
+        yield "# TYPE pawpaw_gc_duration_seconds histogram\n"
+        yield _format_histogram("pawpaw_gc_duration_seconds", 'source', HEAP_SOURCE, self.gc_pauses)
+        for label, registry, attrs in (('phase', self.phases, ('alloc_max', 'free_min')),
+                                       ('route', self.routes, ('alloc_max', 'free_min', 'retained_max'))):
+            for attr in attrs:
+                name = "pawpaw_%s_heap_%s_bytes" % (label, attr)
+                yield "# TYPE %s gauge\n" % name
+                for key, stats in registry.items():
+                    value = getattr(stats, attr)
+                    if not value is None:
+                        yield '%s{%s="%s"} %d\n' % (name, label, _escape_label(key), value)
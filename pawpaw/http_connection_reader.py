@@ -4,77 +4,303 @@ try:
     import sys
     from sys import print_exception #micropython specific
 except ImportError:
-    import traceback
-    print_exception = lambda exc, file_: traceback.print_exc(file=file_)
+    def print_exception(exc, file_):
+        import traceback #CPython, deferred until an exception is printed
+        traceback.print_exc(file=file_)
     
 try:
     from collections import OrderedDict
 except ImportError: 
     from ucollections import OrderedDict #micropython specific
     
+try:
+    import select
+except ImportError:
+    import uselect as select #micropython specific
+
+from .sys_tools import ticks_ms, ticks_diff
 from . import url_tools
+from . import trace
+
+FORM_URLENCODED = 'application/x-www-form-urlencoded'
+FORM_MULTIPART  = 'multipart/form-data' #left unread for pawpaw.multipart
+#shared by all requests without a query string, it is read-only
+_EMPTY_QUERY = url_tools.LazyQueryDict()
+
+#default limits on what a client may send, see HttpConnectionReader
+MAX_LINE       = 2048  #bytes of the request line and of each header line
+MAX_HEADERS    = 32
+HEADER_TIMEOUT = 5     #seconds to receive the request line and headers
+MAX_BODY       = 16384 #bytes
+MAX_UPLOAD     = None  #bytes of a multipart body, streamed so unlimited
+
+#bodies up to this size are read into a buffer kept by the reader, larger ones
+#are rare enough to be allocated each time rather than hold the heap
+BODY_BUFFER = 512
 
-DEBUG = False
-DEBUG = True
+DEBUG = trace.DEBUG_ENABLED
+################################################################################
+# Exceptions
+class HttpError(Exception):
+    #a request that is answered early with an error status and no handler
+    def __init__(self, status, msg = ""):
+        Exception.__init__(self, msg)
+        self.status = status
 ################################################################################
 # Classes
 class HttpRequest(object):
-    __slots__ = 'method','path','match','args','headers','client_address','body'
+    FIELDS = ('method','path','query','match','args','form','headers','client_address','body',
+              'stream','content_length')
+    __slots__ = FIELDS + ('_args','_form')
+    def __init__(self):
+        self.headers = OrderedDict()
+        self._args = None #LazyQueryDicts kept for reuse, made on first need
+        self._form = None
+        self.reset()
+
+    def reset(self):
+        #forgets the request, keeping the containers for the next one, see
+        #HttpServer.pool_requests
+        self.method = self.path = self.query = None
+        self.match = self.client_address = self.body = None
+        self.stream = self.content_length = None
+        self.args = self.form = _EMPTY_QUERY
+        self.headers.clear()
+
     def str_lines(self):
         buff = []
-        for attr in self.__slots__:
+        for attr in self.FIELDS:
             buff.append("%s: %s" % (attr, getattr(self,attr)))
         return buff
     def __str__(self):
         return "\n".join(self.str_lines())
 
 class HttpConnectionReader(object):
-    def __init__(self, conn_rfile, client_address):
+    def __init__(self, conn_rfile, client_address,
+                 max_line       = MAX_LINE,
+                 max_headers    = MAX_HEADERS,
+                 header_timeout = HEADER_TIMEOUT, #the socket timeout too
+                 max_body       = MAX_BODY,
+                 max_upload     = MAX_UPLOAD,
+                 sock           = None, #enforces the header deadline if given
+                 ):
+        self._conn_rfile = conn_rfile
+        self.client_address = client_address
+        self.sock           = sock
+        self.max_line       = max_line
+        self.max_headers    = max_headers
+        self.header_timeout = header_timeout
+        self.max_body       = max_body
+        self.max_upload     = max_upload
+        self._body_buff     = None
+        self._poller        = None
+
+    def reset(self, conn_rfile = None, client_address = None, sock = None):
+        #reuses the reader for another connection, the limits are kept
         self._conn_rfile = conn_rfile
         self.client_address = client_address
+        self.sock = sock
 
-    def parse_request(self):
+    def _time_left(self, deadline_t0):
+        #whole milliseconds left to receive the headers (micropython's poll
+        #takes only an int, even with a float header_timeout), 408 once they
+        #are up
+        left = self.header_timeout*1000 - ticks_diff(ticks_ms(), deadline_t0)
+        if left <= 0:
+            raise HttpError(408, "headers took longer than %ss" % self.header_timeout)
+        return max(1, int(left))
+
+    def _readline(self, deadline_t0):
+        #a line of at most max_line bytes, received before the header deadline
+        limit = self.max_line + 1
+        if self.sock is None or self.header_timeout is None:
+            line = self._conn_rfile.readline(limit)
+        else:
+            line = self._readline_by_deadline(deadline_t0, limit)
+        if len(line) > self.max_line:
+            raise HttpError(400, "line longer than %d bytes" % self.max_line)
+        if not self.header_timeout is None:
+            self._time_left(deadline_t0)
+        return str(line,'utf8')
+
+    def _readline_by_deadline(self, deadline_t0, limit):
+        #a socket timeout restarts with every byte received, so a client
+        #trickling bytes would hold a plain readline far past the deadline,
+        #instead every wait on the socket is bounded by the time left
+        rfile = self._conn_rfile
+        sock  = self.sock
+        peek  = getattr(rfile, 'peek', None)
+        buff  = []
+        count = 0
+        while count < limit:
+            left = self._time_left(deadline_t0)
+            if not rfile is sock:
+                #a file made by CPython's makefile, look at what has arrived
+                #with at most one recv, then take up to the end of line
+                sock.settimeout(left/1000)
+                if not peek is None: #buffered
+                    data = peek(1)
+                else:
+                    data = sock.recv(limit - count, socket.MSG_PEEK)
+                if not data:
+                    break #connection closed
+                pos = data.find(b"\n", 0, limit - count)
+                if pos >= 0:
+                    n = pos + 1
+                else:
+                    n = min(len(data), limit - count)
+                chunk = rfile.read(n) #already received, does not block
+            else:
+                #the socket itself (micropython), wait until readable and
+                #take what has arrived without blocking
+                poller = self._poller
+                if poller is None:
+                    self._poller = poller = select.poll()
+                poller.register(sock, select.POLLIN)
+                try:
+                    if not poller.poll(left):
+                        raise HttpError(408, "headers took longer than %ss" % self.header_timeout)
+                finally:
+                    poller.unregister(sock)
+                sock.settimeout(0)
+                try:
+                    chunk = rfile.readline(limit - count)
+                finally:
+                    sock.settimeout(self.header_timeout)
+                if chunk is None:
+                    continue #nothing arrived after all
+                if not chunk:
+                    break #connection closed
+            buff.append(chunk)
+            count += len(chunk)
+            if chunk.endswith(b"\n"):
+                break
+        return b"".join(buff)
+
+    def _read_body(self, clen):
+        if clen > BODY_BUFFER:
+            return str(self._conn_rfile.read(clen),'utf8')
+        buff = self._body_buff
+        if buff is None:
+            self._body_buff = buff = bytearray(BODY_BUFFER)
+        mv = memoryview(buff)
+        pos = 0
+        while pos < clen:
+            count = self._conn_rfile.readinto(mv[pos:clen])
+            if not count:
+                break #closed early, the body is what was received, like read()
+            pos += count
+        return str(mv[:pos],'utf8')
+
+    def parse_request(self, request = None):
+        #parses the request head and reads its body, returns None on a
+        #connection closed without a request and raises HttpError on requests
+        #exceeding the limits, `request` is a reset HttpRequest to fill in,
+        #else a new one is made
+        request = self.parse_head(request)
+        if not request is None:
+            self.read_body(request)
+        return request
+        
+    def parse_head(self, request = None):
         # self.rfile is a file-like object created by the handler;
         # we can now use e.g. readline() instead of raw recv() calls
-        #parse the request header
-        request_line = str(self._conn_rfile.readline(),'utf8').strip()
+        #parse the request line and headers only, so the server can decide on
+        #the request before its body takes any memory, see `read_body`
+        t0 = ticks_ms()
+        request_line = self._readline(t0).strip()
+        if not request_line:
+            self.handle_malformed_request_line(request_line)
+            return None
         try:
             method, req_url, protocol = request_line.split()
         except ValueError:
             self.handle_malformed_request_line(request_line)
-            return None
+            raise HttpError(400, "malformed request line")
         #split off any params if they exist
         req = req_url.split("?")
         req_path = req[0]
-        params = {}
+        #the query is only parsed if and when the handler uses request.args
+        if request is None:
+            request = HttpRequest()
+        query  = ""
+        params = _EMPTY_QUERY
         if len(req) == 2:
-             params = url_tools.parse_qs(req[1])
+             query  = req[1]
+             params = request._args
+             if params is None:
+                 request._args = params = url_tools.LazyQueryDict()
+             params.reset(query)
         #read the remaining request headers
-        headers = OrderedDict()
+        headers = request.headers
         while True:
-            line = str(self._conn_rfile.readline(),'utf8').strip()
-            if not line or line == '\r\n':
+            line = self._readline(t0).strip()
+            if not line:
                 break
-            key, val = line.split(':',1)
+            if len(headers) >= self.max_headers:
+                raise HttpError(400, "more than %d headers" % self.max_headers)
+            try:
+                key, val = line.split(':',1)
+            except ValueError:
+                raise HttpError(400, "malformed header line")
             headers[key] = val
-        #check the method
-        body = None
-        if method == "POST": #there might be a message body
-            clen = headers.get('Content-Length')
-            if not clen is None:
-                body = str(self._conn_rfile.read(int(clen)),'utf8')
+        if not self.sock is None and not self.header_timeout is None:
+            #the body reads get the whole timeout again
+            self.sock.settimeout(self.header_timeout)
         
-        #construct the request object, similar to Flask names
-        request = HttpRequest()
+        #fill in the request object, similar to Flask names
         request.method  = method
         request.path    = req_path
+        request.query   = query
         request.match   = None
         request.args    = params
+        request.form    = _EMPTY_QUERY
         request.headers = headers
         request.client_address = self.client_address
-        request.body    = body
+        request.body    = None
+        request.stream  = None
+        request.content_length = None
+        return request
+        
+    def read_body(self, request):
+        #reads the body of a request from `parse_head` into request.body (and
+        #request.form), an upload is left on the connection as request.stream
+        if request.method != "POST": #only a POST might have a message body
+            return request
+        headers = request.headers
+        clen = headers.get('Content-Length')
+        ctype = headers.get('Content-Type')
+        if not ctype is None:
+            ctype = ctype.strip()
+        if not clen is None:
+            try:
+                clen = int(clen)
+            except ValueError:
+                raise HttpError(400, "bad Content-Length")
+            if clen < 0:
+                raise HttpError(400, "bad Content-Length")
+        if not ctype is None and ctype.startswith(FORM_MULTIPART):
+            #uploads are left on the connection for the handler to stream,
+            #see pawpaw.multipart
+            if clen is None:
+                raise HttpError(411, "multipart body without Content-Length")
+            if not self.max_upload is None and clen > self.max_upload:
+                raise HttpError(413, "upload over %d bytes" % self.max_upload)
+            request.stream = self._conn_rfile
+            request.content_length = clen
+        elif not clen is None:
+            if clen > self.max_body:
+                raise HttpError(413, "body over %d bytes" % self.max_body)
+            body = self._read_body(clen)
+            request.body = body
+            if not ctype is None and ctype.startswith(FORM_URLENCODED):
+                form = request._form
+                if form is None:
+                    request._form = form = url_tools.LazyQueryDict()
+                form.reset(body)
+                request.form = form
         return request
         
     def handle_malformed_request_line(self, request_line = ""):
-        print("WARNING: got malformed request_line '%s'" % request_line)
+        trace.warning("got malformed request_line '%s'", request_line)
 
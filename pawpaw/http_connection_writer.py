@@ -4,8 +4,9 @@ try:
     import sys
     from sys import print_exception #micropython specific
 except ImportError:
-    import traceback
-    print_exception = lambda exc: traceback.print_exc()
+    def print_exception(exc):
+        import traceback #CPython, deferred until an exception is printed
+        traceback.print_exc()
 
 try:
     from collections import OrderedDict
@@ -18,19 +19,141 @@ except ImportError:
     import ujson as json #micropython specific
     
 from .template_engine import Template, LazyTemplate
+from . import json_stream
+from . import trace
 
-DEBUG = False
-DEBUG = True
+DEBUG = trace.DEBUG_ENABLED
 
 MIME_TYPES = {
+    "css"  : "text/css",
+    "gif"  : "image/gif",
+    "htm"  : "text/html",
     "html" : "text/html",
+    "ico"  : "image/x-icon",
     "jpeg" : "image/jpeg",
     "jpg"  : "image/jpeg",
+    "js"   : "application/javascript",
     "json" : "application/json",
+    "png"  : "image/png",
+    "svg"  : "image/svg+xml",
     "txt"  : "text/plain",
     "yaml" : "text/yaml",
 }
+_EVENT_STREAM_HEADERS = b"Cache-Control: no-cache\r\n"
+
 DEFAULT_MIME_TYPE = 'application/octet-stream'
+DEFAULT_CONTENT_TYPE = 'text/html'
+
+#bodies up to this size go out in the same write as the headers
+COALESCE_LIMIT = 1024
+
+STATUS_REASONS = (
+    (101, "Switching Protocols"),
+    (200, "OK"),
+    (201, "Created"),
+    (204, "No Content"),
+    (301, "Moved Permanently"),
+    (302, "Found"),
+    (304, "Not Modified"),
+    (400, "Bad Request"),
+    (401, "Unauthorized"),
+    (403, "Forbidden"),
+    (404, "Not Found"),
+    (405, "Method Not Allowed"),
+    (408, "Request Timeout"),
+    (411, "Length Required"),
+    (413, "Payload Too Large"),
+    (500, "Internal Server Error"),
+    (503, "Service Unavailable"),
+)
+
+def _make_status_lines():
+    #encoded status lines keyed by both the code and the full line text
+    table = {}
+    for code, reason in STATUS_REASONS:
+        line = "HTTP/1.1 %d %s" % (code, reason)
+        table[code] = table[line] = bytes(line + "\r\n", 'utf8')
+    return table
+
+_status_lines = _make_status_lines()
+
+def status_line(status):
+    #status is a code or a full status line like "HTTP/1.1 200 OK", either
+    #way it is encoded once and then looked up
+    line = _status_lines.get(status)
+    if line is None:
+        if isinstance(status, int):
+            text = "HTTP/1.1 %d " % status #the reason phrase may be empty
+        else:
+            text = status.rstrip()
+        _status_lines[status] = line = bytes(text + "\r\n", 'utf8')
+    return line
+
+_header_blocks = {}
+
+def header_block(content_type, chunked):
+    #the encoded headers shared by every response of a given shape, a block
+    #for chunked transfer ends the header section, otherwise it ends with
+    #'Content-Length: ' for the length to be appended
+    key = (content_type, chunked)
+    block = _header_blocks.get(key)
+    if block is None:
+        if chunked:
+            tail = "Transfer-Encoding: chunked\r\n\r\n"
+        else:
+            tail = "Content-Length: "
+        block = bytes("Content-Type: %s\r\n%s" % (content_type, tail), 'utf8')
+        _header_blocks[key] = block
+    return block
+
+_error_responses = {}
+
+def error_response(status, retry_after = None):
+    #a complete response without body, for requests answered early by the
+    #server, the connection is closed right after it
+    key = (status, retry_after)
+    resp = _error_responses.get(key)
+    if resp is None:
+        resp = status_line(status)
+        if not retry_after is None:
+            resp += bytes("Retry-After: %d\r\n" % retry_after, 'utf8')
+        resp += b"Content-Length: 0\r\nConnection: close\r\n\r\n"
+        _error_responses[key] = resp
+    return resp
+
+#the common shapes are ready before the first response
+for _ctype in (DEFAULT_CONTENT_TYPE, MIME_TYPES["json"]):
+    header_block(_ctype, True)
+    header_block(_ctype, False)
+
+def encode_headers(headers):
+    #encodes any extra headers, Content-Type is left to header_block
+    buff = []
+    for key, val in headers.items():
+        key = key.strip()
+        if key == 'Content-Type':
+            continue
+        buff.append("%s: %s\r\n" % (key, val.strip()))
+    return bytes("".join(buff), 'utf8')
+
+LAST_CHUNK = b"0\r\n\r\n" #ends a chunked body
+
+def frame_chunk(chunk):
+    #one chunk of the chunked transfer coding, a str is encoded first (count
+    #the bytes, not the chars) and an empty chunk frames to b"" since a zero
+    #length chunk would end the body early, the size goes in hexadecimal
+    if isinstance(chunk, str):
+        chunk = bytes(chunk,'utf8')
+    chunk_len = len(chunk)
+    if not chunk_len:
+        return b""
+    return bytes("%X\r\n" % chunk_len,'utf8') + chunk + b"\r\n"
+
+def _chain(first, second, rest):
+    yield first
+    yield second
+    for chunk in rest:
+        yield chunk
 ################################################################################
 # Classes
 
@@ -40,41 +163,87 @@ class HttpConnectionWriter(object):
     def __init__(self, conn_wfile, request):
         self._conn_wfile = conn_wfile
         self.request    = request
+        self.upgrade    = None #set by a handler taking over the connection
+
+    def reset(self, conn_wfile = None, request = None):
+        #reuses the writer for another response, see HttpServer.pool_requests
+        self._conn_wfile = conn_wfile
+        self.request    = request
+        self.upgrade    = None
         
     def send_file(self, filename,
-                  status  = "HTTP/1.1 200 OK",
+                  status  = 200,
                   headers = None,
-                  chunksize = 64):
-        if headers is None:
-            headers = OrderedDict()
-        if not 'Content-Type' in headers.keys():
+                  chunksize = 64,
+                  content_type = None, #default from the extension
+                  ):
+        if content_type is None:
             #determine MIME types based on extension
             ext = filename.split("/")[-1].split(".")[-1]
-            mtype = MIME_TYPES.get(ext,DEFAULT_MIME_TYPE)
-            headers['Content-Type'] = mtype
-        #wrap the file in a generator
+            content_type = MIME_TYPES.get(ext,DEFAULT_MIME_TYPE)
+        #wrap the file in a generator, read as bytes so that binary files
+        #survive and the chunks are sent without encoding
         def gen_tmp():
-            with open(filename, 'r') as f:
+            with open(filename, 'rb') as f:
                 while True:
                     chunk = f.read(chunksize)
                     if not chunk:
                         return
                     yield chunk
         tmp = gen_tmp()
-        self.render_template(tmp, headers=headers)
+        self.render_template(tmp, status=status, headers=headers,
+                             content_type=content_type)
         
-    def send_json(self, resp):
-        tmp = Template(text=json.dumps(resp))
-        headers = OrderedDict()
-        headers['Content-Type'] = 'application/json'
-        self.render_template(tmp, headers = headers)
+    def send_json(self, resp, status = 200, content_type = None):
+        #streams the encoded chunks straight out, a document that fits in one
+        #chunk is sent with a Content-Length instead of chunked framing
+        head = status_line(status)
+        ctype = content_type
+        if ctype is None:
+            ctype = MIME_TYPES["json"]
+        chunks = json_stream.iter_encode(resp, chunksize = COALESCE_LIMIT)
+        first  = next(chunks)
+        try: #next() with a default is missing from most micropython ports
+            second = next(chunks)
+        except StopIteration:
+            second = None
+        if second is None:
+            self._send_with_length(head + header_block(ctype, False),
+                                   bytes(first,'utf8'))
+        else:
+            self._conn_wfile.write(head + header_block(ctype, True))
+            self._send_by_chunks(_chain(first, second, chunks))
+        
+    def send_event_stream(self, events,
+                          heartbeat = None, #seconds, default event_stream.DEFAULT_HEARTBEAT
+                          retry = None, #milliseconds clients wait to reconnect
+                          ):
+        #starts a text/event-stream response, HttpServer keeps the connection
+        #and sends the events as `events` yields them, see event_stream
+        from . import event_stream
+        if heartbeat is None:
+            heartbeat = event_stream.DEFAULT_HEARTBEAT
+        head = (status_line(200) + _EVENT_STREAM_HEADERS +
+                header_block(event_stream.CONTENT_TYPE, True))
+        if not retry is None:
+            head += frame_chunk("retry: %d\n\n" % retry)
+        self._conn_wfile.write(head)
+        self._flush()
+        self.upgrade = event_stream.EventStream(self.request, events,
+                                                heartbeat = heartbeat)
         
     def render_template(self, tmp,
-                        status  = "HTTP/1.1 200 OK",
-                        headers = None):
-        if headers is None:
-            headers = OrderedDict()
-        headers['Content-Type'] = headers.get('Content-Type', 'text/html')
+                        status  = 200, #a code or a full status line
+                        headers = None, #extra headers
+                        content_type = None,
+                        ):
+        head = status_line(status)
+        if not headers is None:
+            #a Content-Type in headers wins for backwards compatibility
+            content_type = headers.get('Content-Type', content_type)
+            head += encode_headers(headers)
+        if content_type is None:
+            content_type = DEFAULT_CONTENT_TYPE
         # test if we can iterate over tmp to produce output text
         # the follow is a hueristic iterablility test that works for generators
         # and other iterable containers on upython
@@ -89,31 +258,25 @@ class HttpConnectionWriter(object):
             
         if tmp_isiterable:
             #use chunked transfer coding for an iterable template
-            headers['Transfer-Encoding'] = 'chunked'
-            #send headers
-            self._send_response_headers(status, headers)
+            self._conn_wfile.write(head + header_block(content_type, True))
             #send in chunks
             self._send_by_chunks(tmp)
         else:
             content = tmp.render().read() #read the StringIO or stream interface
-            #compute and send using Content-Length
-            headers['Content-Length'] = "%d" % len(content)
-            #send headers
-            self._send_response_headers(status, headers)
-            #send all at once
-            self._send(content)
+            #IMPORTANT, encode before counting!
+            self._send_with_length(head + header_block(content_type, False),
+                                   bytes(content,'utf8'))
         
-    def _send_response_headers(self, status, headers):
-        w  = self._conn_wfile.write
-        nl = self._newline_bytes
-        w(bytes(status.rstrip(),'utf8'))
-        w(nl)
-        for key, val in headers.items():
-            line = "%s: %s" % (key.strip(),val.strip())
-            w(bytes(line,'utf8'))
-            w(nl)
-        #IMPORTANT final blank line
-        w(nl)
+    def _send_with_length(self, head, body):
+        #head ends with 'Content-Length: ', only the length is formatted here
+        head += bytes("%d\r\n\r\n" % len(body), 'utf8')
+        w = self._conn_wfile.write
+        if len(body) <= COALESCE_LIMIT:
+            w(head + body)
+        else:
+            w(head)
+            w(body)
+        self._flush()
         
     def _send(self, content):
         self._conn_wfile.write(bytes(content,'utf8'))
@@ -121,18 +284,15 @@ class HttpConnectionWriter(object):
         
     def _send_by_chunks(self, chunk_iter):
         w  = self._conn_wfile.write
-        nl = self._newline_bytes
         for chunk in chunk_iter:
-            chunk_bytes = bytes(chunk,'utf8')
-            chunk_len = len(chunk_bytes)     #IMPORTANT, encode before counting!
-            w(bytes("%X" % chunk_len,'utf8')) #chunk size specified in hexadecimal
-            w(nl)
-            w(chunk_bytes)
-            w(nl)
+            #encoded chunks, e.g. from a CompiledTemplate, are sent as they are,
+            #the framing goes out in the same write as the chunk, on
+            #micropython every write is a send
+            data = frame_chunk(chunk)
+            if data:
+                w(data)
         #IMPORTANT chunk trailer
-        w(b"0")
-        w(nl)
-        w(nl)
+        w(LAST_CHUNK)
         self._flush()
         
     def _flush(self):
@@ -13,8 +13,9 @@ try:
     import sys
     from sys import print_exception #micropython specific
 except ImportError:
-    import traceback
-    print_exception = lambda exc, file_: traceback.print_exc(file=file_)
+    def print_exception(exc, file_):
+        import traceback #CPython, deferred until an exception is printed
+        traceback.print_exc(file=file_)
 
 
 try:
@@ -26,17 +27,31 @@ try:
     import json
 except ImportError:
     import ujson as json #micropython specific
+
+try:
+    import select
+except ImportError:
+    import uselect as select #micropython specific
     
 
 
     
     
 from .template_engine import Template, LazyTemplate
-from .http_connection_reader import HttpConnectionReader
-from .http_connection_writer import HttpConnectionWriter
+from .http_connection_reader import HttpConnectionReader, HttpError, HEADER_TIMEOUT
+from .sys_tools import ticks_ms, ticks_diff
+from .http_connection_writer import HttpConnectionWriter, error_response
+from .gc_policy import CollectAlways
+from . import trace
 
-DEBUG = False
-DEBUG = True
+DEBUG = trace.DEBUG_ENABLED
+
+def _poll_key(obj):
+    #CPython polls file descriptors, micropython polls the objects themselves
+    try:
+        return obj.fileno()
+    except AttributeError:
+        return obj
 ################################################################################
 # Classes
 
@@ -49,16 +64,45 @@ class HttpServer(object):
     allow_reuse_address = True
     rbufsize = -1
     wbufsize = -1
+    max_websockets = 4 #further upgrades are closed with CLOSE_TRY_LATER
+    max_event_streams = 4 #further event streams are ended right away
+    event_stream_interval = 0.1 #seconds between steps of the event streams
+    #reuse the request, reader and writer objects from one request to the
+    #next, handlers must then not keep the request or context (or its args,
+    #form and headers) once they return, websockets and event streams may
+    pool_requests = True
     
     handler_registry = OrderedDict()
 
     def __init__(self, server_address, app,
                  init_socket = True,
                  timeout = None, #default is BLOCKING
+                 monitors = None,
+                 gc_policy = None,  #default collects after every request
+                 request_limits = None, #HttpConnectionReader keyword arguments
+                 admission = None, #an AdmissionControl, default admits all
                  ):
         #BaseServer.__init__(self, server_address, RequestHandlerClass)
         self.server_address = server_address
         self.app = app
+        #RequestMonitor instances notified as each request is handled
+        if monitors is None:
+            monitors = []
+        self.monitors = monitors
+        if gc_policy is None:
+            gc_policy = CollectAlways()
+        gc_policy.install()
+        self.gc_policy = gc_policy
+        if request_limits is None:
+            request_limits = {}
+        self.request_limits = request_limits
+        self.admission = admission
+        self.websockets = [] #open WebSocket connections
+        self.event_streams = [] #open EventStream responses
+        #the pooled objects, see pool_requests
+        self._conn_reader = HttpConnectionReader(None, None, **request_limits)
+        self._conn_writer = HttpConnectionWriter(None, None)
+        self._spare_request = None
         self.__is_shut_down = None #FIXME threading.Event()
         self.__shutdown_request = False
         self._timeout = timeout
@@ -92,7 +136,7 @@ class HttpServer(object):
             import errno
             if exc.args[0] == errno.ENOMEM:
                 #listener is already registered
-                print("WARNING: handling %s" % exc)
+                trace.warning("handling %s", exc)
                 self.socket.close()
                 self.init_socket()
             else:
@@ -117,60 +161,118 @@ class HttpServer(object):
         conn_rfile = None
         conn_wfile = None
         request = None
+        spare = None
+        route = None
+        upgrade = None
+        monitors = self.monitors
+        pooled = self.pool_requests
         #outer block handles all exceptions and logs them
         try:
             #inner block handles OSError, looking for timeouts otherwise 
             #reraising them for outer block to catch
             try:
                 phase = "listening for connection"
+                if ((self.websockets or self.event_streams)
+                        and not self.serve_connections()):
+                    return False  #timed out, no connection to accept
                 client_sock, client_address = self.socket.accept()
-                phase = "accepted connection from '%s'" % (client_address,)
+                for m in monitors:
+                    m.request_begin()
+                phase = "accepted connection"
+                #bounds every read and write, so a stalled client can't hold
+                #the server for longer than this at a time, the reader also
+                #bounds the headers as a whole
+                client_sock.settimeout(self.request_limits.get('header_timeout', HEADER_TIMEOUT))
                 conn_rfile = client_sock.makefile('rb', self.rbufsize)
                 conn_wfile = client_sock.makefile('wb', self.wbufsize)
                 #-------------------------------------------------------------------
                 #reading request phase
                 #on micropython makefile does nothing returns a usocket.socket obj
-                conn_reader = HttpConnectionReader(conn_rfile, client_address)
+                if pooled:
+                    conn_reader = self._conn_reader
+                    conn_reader.reset(conn_rfile, client_address, client_sock)
+                    spare = self._spare_request
+                    self._spare_request = None
+                else:
+                    conn_reader = HttpConnectionReader(conn_rfile, client_address,
+                                                       sock = client_sock,
+                                                       **self.request_limits)
                 phase = 'reading request'
-                request = conn_reader.parse_request()
+                for m in monitors:
+                    m.phase_begin('read')
+                try:
+                    request = conn_reader.parse_head(spare)
+                except HttpError as exc:
+                    self.reject_request(conn_wfile, exc.status, exc)
+                    return False
                 if request is None:
+                    for m in monitors:
+                        m.count('malformed')
                     raise Exception("got null request")
                 #-------------------------------------------------------------------
                 # handler lookup phase
                 phase = 'handler lookup path'
-                handler = None
-                if not request is None:
-                    meth_paths = self.app.path_handler_registry.get(request.method, {})
-                    handler = meth_paths.get(request.path)
-                #could not match a path directly
-                if handler is None:
-                    # try matching against all regex handlers
-                    phase = 'handler lookup regex'
-                    match = None
-                    meth_regexs = self.app.regex_handler_registry.get(request.method, {})
-                    for repr_regex, data in meth_regexs.items():
-                        regex, h = data
-                        match = regex.match(request.path)
-                        if not match is None:
-                            request.match = match
-                            handler = h
-                            break
+                for m in monitors:
+                    m.phase_begin('lookup')
+                handler, route = self.lookup_handler(request)
+                admission = self.admission
+                if not admission is None:
+                    #decided on the headers, a shed request's body is never read
+                    phase = 'admission'
+                    route_priority = getattr(self.app, 'route_priority', None)
+                    if route_priority is None: #not a WebApp
+                        from .admission import PRIORITY_NORMAL
+                        priority = PRIORITY_NORMAL
                     else:
-                        #default no other handler matched
-                        handler = self.app.path_handler_registry['DEFAULT']
+                        priority = route_priority(request.method, route)
+                    if not admission.admit(self, priority):
+                        self.reject_request(conn_wfile, 503, "shed %s" % route,
+                                            retry_after = admission.retry_after)
+                        return False
                 #-------------------------------------------------------------------
                 # response phase
-                conn_writer = HttpConnectionWriter(conn_wfile,request)
+                if pooled:
+                    conn_writer = self._conn_writer
+                    conn_writer.reset(conn_wfile, request)
+                else:
+                    conn_writer = HttpConnectionWriter(conn_wfile,request)
                 phase = 'handling response'
+                for m in monitors:
+                    m.phase_begin('handle')
+                #the body is read once admitted, its time counts to the handle
+                #phase like that of an upload streamed by the handler
+                try:
+                    conn_reader.read_body(request)
+                except HttpError as exc:
+                    self.reject_request(conn_wfile, exc.status, exc)
+                    return False
                 if DEBUG:
                     print("INSIDE 'http_server.handle_request' during %s:" % phase)
                     print("\trequest: %s" % request)
                 handler(conn_writer)
+                upgrade = conn_writer.upgrade
+                if not upgrade is None:
+                    phase = 'opening upgraded connection'
+                    #websockets receive frames, event streams only send
+                    if hasattr(upgrade, 'recv'):
+                        self.open_websocket(upgrade, client_sock)
+                    else:
+                        self.open_event_stream(upgrade, client_sock)
                 return True  #signify that a request was successfully handled
             except socket.timeout as exc: #case for CPython3
+                if not client_sock is None:
+                    for m in monitors:
+                        m.count('timeout')
+                    if phase == 'reading request':
+                        self.reject_request(conn_wfile, 408, exc, count = False)
                 if DEBUG:
                     print("HttpServer.handle_request: timedout (socket.timeout) during {}".format(phase))
             except OSError as exc:
+                if exc.args[0] in (errno.ETIMEDOUT, errno.EAGAIN) and not client_sock is None:
+                    for m in monitors:
+                        m.count('timeout')
+                    if phase == 'reading request':
+                        self.reject_request(conn_wfile, 408, exc, count = False)
                 if exc.args[0] == errno.ETIMEDOUT:  #case for ESP8266
                     if DEBUG:
                         print("HttpServer.handle_request: timedout (ETIMEDOUT) during {}".format(phase))
@@ -183,31 +285,220 @@ class HttpServer(object):
                     raise
             
         except Exception as exc:
-            buff = []
-            buff.append("Context: Exception caught in 'HttpServer.handle_request' during {}".format(phase))
-            if not request is None:
-                buff.append("Request:")
-                for line in request.str_lines():
-                    buff.append("    %s" % line)
-                buff.append("") #final newline
-            msg = "\n".join(buff)
-            #print out message and exception/traceback
+            for m in monitors:
+                m.count('exception')
+            self.log_exception(exc, "HttpServer.handle_request", phase,
+                               client_address, request)
+        finally:
+            if not upgrade is None:
+                #the connection now belongs to the upgrade, on micropython
+                #the files are the socket itself and must stay open
+                if conn_rfile is client_sock:
+                    conn_rfile = None
+                if conn_wfile is client_sock:
+                    conn_wfile = None
+            if not conn_rfile is None:
+                conn_rfile.close()
+            if not conn_wfile is None:
+                conn_wfile.close()
+            if pooled:
+                if request is None:
+                    request = spare
+                self.release_pooled(request, upgrade)
+            if not client_sock is None:
+                if upgrade is None:
+                    client_sock.close()
+                for m in monitors:
+                    m.request_end(route)
+                if self.gc_policy.after_request():
+                    self.collect_garbage()
+            elif self.gc_policy.on_idle(): #no connection was accepted
+                self.collect_garbage()
+            
+    def release_pooled(self, request, upgrade):
+        #drops the references to the finished request, keeping the objects
+        self._conn_reader.reset()
+        self._conn_writer.reset()
+        if not request is None and upgrade is None: #else the upgrade keeps it
+            request.reset()
+            self._spare_request = request
+
+    def reject_request(self, conn_wfile, status, exc, count = True,
+                       retry_after = None):
+        #answers a request which never reaches a handler
+        if count:
+            if status == 408:
+                event = 'timeout'
+            elif status == 400:
+                event = 'malformed'
+            elif status == 503:
+                event = 'shed'
+            else:
+                event = 'rejected'
+            for m in self.monitors:
+                m.count(event)
+        if trace.INFO_ENABLED:
+            trace.info("rejected request with %d: %s", status, exc)
+        try:
+            conn_wfile.write(error_response(status, retry_after))
+            conn_wfile.flush()
+        except (OSError, AttributeError): #client gone, or micropython socket
+            pass
+        
+    def log_exception(self, exc, where, phase, client_address = None, request = None):
+        buff = []
+        buff.append("Context: Exception caught in '{}' during {}".format(where, phase))
+        if not client_address is None:
+            buff.append("Client: %s" % (client_address,))
+        if not request is None:
+            buff.append("Request:")
+            for line in request.str_lines():
+                buff.append("    %s" % line)
+            buff.append("") #final newline
+        msg = "\n".join(buff)
+        #print out message and exception/traceback
+        if trace.ERROR_ENABLED:
             print("*"*40,file=sys.stderr)
             print("* EXCEPTION", file=sys.stderr)
             print("-"*40,file=sys.stderr)
             print(msg, file = sys.stderr)
             print_exception(exc, sys.stderr)
             print("*"*40,file=sys.stderr)
-            #log it as well
-            logger = self.app.get_logger()
-            with logger as entry:
-                entry.write(msg)
-                entry.write_exception(exc)
+        #log it as well
+        logger = self.app.get_logger()
+        with logger as entry:
+            entry.write(msg)
+            entry.write_exception(exc)
+            
+    #---------------------------------------------------------------------------
+    # websockets and event streams, connections kept open past handle_request
+    def open_websocket(self, ws, client_sock):
+        from .websocket import CLOSE_TRY_LATER
+        ws.open(client_sock)
+        if len(self.websockets) >= self.max_websockets:
+            ws.close(CLOSE_TRY_LATER)
+            return
+        self.websockets.append(ws)
+        self.dispatch_websocket(ws, None)
+        if ws.closed:
+            self.websockets.remove(ws)
+        
+    def open_event_stream(self, stream, client_sock):
+        stream.open(client_sock)
+        if len(self.event_streams) >= self.max_event_streams:
+            stream.finish()
+            return
+        self.event_streams.append(stream)
+        
+    def serve_connections(self):
+        #polls the open websockets and event streams together with the
+        #listening socket, handling websocket frames and stepping the event
+        #streams until a connection is waiting (True) or the socket timeout
+        #passes without one (False)
+        self.websockets = [ws for ws in self.websockets if not ws.closed]
+        self.event_streams = [es for es in self.event_streams if not es.closed]
+        poller = select.poll()
+        poller.register(self.socket, select.POLLIN)
+        by_key = {}
+        for conn in self.websockets + self.event_streams:
+            poller.register(conn.sock, select.POLLIN)
+            by_key[_poll_key(conn.sock)] = conn
+        websockets = self.websockets
+        step_ms = int(self.event_stream_interval*1000)
+        t0 = ticks_ms()
+        while by_key:
+            if self._timeout is None:
+                timeout_ms = -1
+            else:
+                timeout_ms = int(self._timeout*1000) - ticks_diff(ticks_ms(), t0)
+                if timeout_ms <= 0:
+                    return False
+            if self.event_streams and (timeout_ms < 0 or step_ms < timeout_ms):
+                timeout_ms = step_ms
+            events = poller.poll(timeout_ms)
+            accept = False
+            for event in events:
+                conn = by_key.get(_poll_key(event[0]))
+                if conn is None:
+                    accept = True
+                elif conn in websockets:
+                    self.receive_websocket(conn)
+                else:
+                    #clients never send on an event stream, it was closed
+                    conn.abort()
+            if self.event_streams:
+                self.step_event_streams()
+            for key in list(by_key.keys()):
+                if by_key[key].closed:
+                    poller.unregister(key) #fd on CPython, object on micropython
+                    del by_key[key]
+            if accept:
+                return True
+        return True #back to blocking in accept
+        
+    def step_event_streams(self):
+        for stream in self.event_streams:
+            try:
+                stream.step()
+            except OSError: #includes write timeouts, the client is gone
+                stream.abort()
+            except Exception as exc:
+                for m in self.monitors:
+                    m.count('exception')
+                self.log_exception(exc, "HttpServer.step_event_streams",
+                                   "streaming events", request = stream.request)
+                stream.abort()
+        self.event_streams = [es for es in self.event_streams if not es.closed]
+        
+    def receive_websocket(self, ws):
+        try:
+            try:
+                message = ws.recv()
+            except OSError: #includes timeouts mid-frame and closed peers
+                ws.abort()
+            else:
+                if not message is None:
+                    self.dispatch_websocket(ws, message)
         finally:
-            if not conn_rfile is None:
-                conn_rfile.close()
-            if not conn_rfile is None:
-                conn_wfile.close()
-            if not client_sock is None:
-                client_sock.close()
-            gc.collect()
+            if ws.closed and ws in self.websockets:
+                self.websockets.remove(ws)
+            if self.gc_policy.after_request():
+                self.collect_garbage()
+        
+    def dispatch_websocket(self, ws, message):
+        try:
+            ws.handler(ws, message)
+        except Exception as exc:
+            from .websocket import CLOSE_SERVER_ERROR
+            for m in self.monitors:
+                m.count('exception')
+            self.log_exception(exc, "HttpServer.dispatch_websocket",
+                               "handling message", request = ws.request)
+            ws.close(CLOSE_SERVER_ERROR)
+            
+    def lookup_handler(self, request):
+        #returns (handler, route) where route is the registry key that matched,
+        #on a regex match request.match is set as well
+        meth_paths = self.app.path_handler_registry.get(request.method, {})
+        handler = meth_paths.get(request.path)
+        if not handler is None:
+            return handler, request.path
+        #could not match a path directly
+        # try matching against all regex handlers
+        meth_regexs = self.app.regex_handler_registry.get(request.method, {})
+        for repr_regex, data in meth_regexs.items():
+            regex, h = data
+            match = regex.match(request.path)
+            if not match is None:
+                request.match = match
+                return h, repr_regex
+        #default no other handler matched
+        return self.app.path_handler_registry['DEFAULT'], 'DEFAULT'
+        
+    def collect_garbage(self):
+        monitors = self.monitors
+        for m in monitors:
+            m.gc_begin()
+        gc.collect()
+        for m in monitors:
+            m.gc_end()
@@ -0,0 +1,352 @@
+# Incremental JSON tokenizer which reads from a file-like object in small
+# chunks and produces parse events instead of a materialized tree.
+# The events are 2-tuples of (event, value) where event is one of the module
+# constants below.  Keys and scalars carry their decoded value, all other events
+# carry None.  Only arrays are ever rebuilt into Python objects (see
+# `build_value`) so the peak heap use is bounded by the chunk size plus the
+# largest single scalar or array in the document.
+# The encoder below goes the other way, yielding the JSON text of a Python
+# object in pieces while walking its containers, without the whole string.
+
+try:
+    import json
+except ImportError:
+    import ujson as json #micropython specific
+
+START_MAP   = 'start_map'
+END_MAP     = 'end_map'
+KEY         = 'key'
+START_ARRAY = 'start_array'
+END_ARRAY   = 'end_array'
+VALUE       = 'value'
+
+DEFAULT_CHUNKSIZE = 64
+ENCODE_CHUNKSIZE  = 256
+MAX_DEPTH         = 32 #nesting limit of the encoder, also catches cycles
+SMALL_LIMIT       = 32 #containers of up to this many values go to json.dumps
+
+_WHITESPACE = ' \t\r\n'
+_DELIMITERS = ',:]}' + _WHITESPACE
+_ESCAPES = {
+    '"' : '"',
+    '\\': '\\',
+    '/' : '/',
+    'b' : '\b',
+    'f' : '\f',
+    'n' : '\n',
+    'r' : '\r',
+    't' : '\t',
+}
+_LITERALS = {
+    'true' : True,
+    'false': False,
+    'null' : None,
+}
+
+class JsonStreamReader(object):
+    def __init__(self, stream, chunksize = DEFAULT_CHUNKSIZE):
+        self._stream = stream
+        self._chunksize = chunksize
+        self._buff = ""
+        self._pos  = 0
+        self._offset = 0 #number of chars consumed before the current buffer
+
+    def __iter__(self):
+        return self.events()
+
+    def _error(self, msg):
+        return ValueError("JSON @pos %d: %s" % (self._offset + self._pos, msg))
+
+    def _fill(self):
+        #returns False when the stream is exhausted
+        self._offset += len(self._buff)
+        self._buff = self._stream.read(self._chunksize)
+        self._pos  = 0
+        return bool(self._buff)
+
+    def _next_char(self):
+        if self._pos >= len(self._buff):
+            if not self._fill():
+                return ""
+        c = self._buff[self._pos]
+        self._pos += 1
+        return c
+
+    def _next_token_char(self):
+        #skip whitespace and return the next significant char, "" at EOF
+        while True:
+            c = self._next_char()
+            if not c or not c in _WHITESPACE:
+                return c
+
+    def _expect(self, expected):
+        c = self._next_token_char()
+        if c != expected:
+            raise self._error("expected '%s' got '%s'" % (expected, c))
+
+    def _read_string(self):
+        #the opening quote has already been consumed
+        buff = []
+        while True:
+            if self._pos >= len(self._buff):
+                if not self._fill():
+                    raise self._error("unterminated string")
+            text = self._buff
+            start = self._pos
+            #scan for the next quote or escape within the current buffer
+            end = text.find('"', start)
+            esc = text.find('\\', start)
+            if esc != -1 and (end == -1 or esc < end):
+                buff.append(text[start:esc])
+                self._pos = esc + 1
+                buff.append(self._read_escape())
+            elif end != -1:
+                buff.append(text[start:end])
+                self._pos = end + 1
+                return "".join(buff)
+            else:
+                buff.append(text[start:])
+                self._pos = len(text)
+
+    def _read_hex4(self):
+        digits = []
+        for i in range(4):
+            c = self._next_char()
+            if not c:
+                raise self._error("unterminated unicode escape")
+            digits.append(c)
+        try:
+            return int("".join(digits), 16)
+        except ValueError:
+            raise self._error("bad unicode escape '\\u%s'" % "".join(digits))
+
+    def _read_escape(self):
+        c = self._next_char()
+        if c == 'u':
+            code = self._read_hex4()
+            if 0xD800 <= code < 0xDC00: #high surrogate, try to pair it up
+                if self._next_char() == '\\' and self._next_char() == 'u':
+                    low = self._read_hex4()
+                    if 0xDC00 <= low < 0xE000:
+                        code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+                        return chr(code)
+                raise self._error("unpaired surrogate in unicode escape")
+            return chr(code)
+        rep = _ESCAPES.get(c)
+        if rep is None:
+            raise self._error("bad escape '\\%s'" % c)
+        return rep
+
+    def _read_literal(self, c):
+        #numbers and the bare words true, false and null
+        buff = [c]
+        while True:
+            c = self._next_char()
+            if not c:
+                break
+            if c in _DELIMITERS:
+                self._pos -= 1 #push the delimiter back
+                break
+            buff.append(c)
+        word = "".join(buff)
+        if word in _LITERALS:
+            return _LITERALS[word]
+        try:
+            if '.' in word or 'e' in word or 'E' in word:
+                return float(word)
+            return int(word)
+        except ValueError:
+            raise self._error("bad literal '%s'" % word)
+
+    def _read_key(self, c):
+        if c != '"':
+            raise self._error("expected string key got '%s'" % c)
+        key = self._read_string()
+        self._expect(':')
+        return key
+
+    def events(self):
+        stack = [] #holds '{' or '[' for every open container
+        c = self._next_token_char()
+        if not c:
+            raise self._error("no JSON document found")
+        while True:
+            #-------------------------------------------------------------------
+            # parse a value starting at char c
+            if c == '{':
+                yield (START_MAP, None)
+                c = self._next_token_char()
+                if c != '}':
+                    stack.append('{')
+                    yield (KEY, self._read_key(c))
+                    c = self._next_token_char()
+                    continue
+                yield (END_MAP, None)
+            elif c == '[':
+                yield (START_ARRAY, None)
+                c = self._next_token_char()
+                if c != ']':
+                    stack.append('[')
+                    continue
+                yield (END_ARRAY, None)
+            elif c == '"':
+                yield (VALUE, self._read_string())
+            elif not c:
+                raise self._error("unexpected end of document")
+            else:
+                yield (VALUE, self._read_literal(c))
+            #-------------------------------------------------------------------
+            # a value is complete, close containers until the next value starts
+            while True:
+                c = self._next_token_char()
+                if not stack:
+                    if c:
+                        raise self._error("trailing data '%s'" % c)
+                    return
+                top = stack[-1]
+                if c == ',':
+                    c = self._next_token_char()
+                    if top == '{':
+                        yield (KEY, self._read_key(c))
+                        c = self._next_token_char()
+                    break
+                elif c == '}' and top == '{':
+                    stack.pop()
+                    yield (END_MAP, None)
+                elif c == ']' and top == '[':
+                    stack.pop()
+                    yield (END_ARRAY, None)
+                elif not c:
+                    raise self._error("unexpected end of document")
+                else:
+                    raise self._error("unexpected char '%s'" % c)
+
+def iter_events(stream, chunksize = DEFAULT_CHUNKSIZE):
+    return JsonStreamReader(stream, chunksize = chunksize).events()
+
+def build_value(event, value, events):
+    """ build the Python object for the value started by (event, value),
+        consuming the rest of its events from the `events` iterator
+    """
+    if event == VALUE:
+        return value
+    if event == START_ARRAY:
+        arr = []
+        for ev, val in events:
+            if ev == END_ARRAY:
+                return arr
+            arr.append(build_value(ev, val, events))
+    elif event == START_MAP:
+        d = {} #same as json.loads
+        for ev, val in events:
+            if ev == END_MAP:
+                return d
+            ev, v = next(events)
+            d[val] = build_value(ev, v, events)
+    raise ValueError("unexpected JSON event '%s'" % event)
+
+def load(stream, chunksize = DEFAULT_CHUNKSIZE):
+    events = iter_events(stream, chunksize = chunksize)
+    ev, val = next(events)
+    value = build_value(ev, val, events)
+    for ev, val in events: #drain to raise on any trailing data
+        pass
+    return value
+
+#-------------------------------------------------------------------------------
+# encoding, the output is the same as json.dumps with its default separators
+def _encode_scalar(value):
+    if value is None:
+        return "null"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, (str, float)): #json handles escapes, nan and inf
+        return json.dumps(value)
+    raise TypeError("%r is not JSON serializable" % (value,))
+
+def _encode_key(key):
+    if not isinstance(key, str):
+        key = _encode_scalar(key) #like json.dumps, 1 becomes "1"
+    return json.dumps(key)
+
+def _weight(value, limit):
+    #the number of values nested in a container, counting stops past limit
+    n = 0
+    for v in (value.values() if isinstance(value, dict) else value):
+        n += 1
+        if n > limit:
+            break
+        if isinstance(v, (dict, list, tuple)):
+            n += _weight(v, limit - n)
+            if n > limit:
+                break
+    return n
+
+def iter_fragments(obj):
+    """ yield the JSON text of obj in small fragments, nested containers are
+        walked with an explicit stack rather than recursion, except for small
+        ones which are encoded in one piece by json.dumps
+    """
+    stack = [] #frames of [items iterator, is map, is first item]
+    value = obj
+    while True:
+        if (isinstance(value, (dict, list, tuple))
+                and _weight(value, SMALL_LIMIT) <= SMALL_LIMIT):
+            yield json.dumps(value)
+        elif isinstance(value, dict):
+            if len(stack) >= MAX_DEPTH:
+                raise ValueError("JSON nesting deeper than %d" % MAX_DEPTH)
+            stack.append([iter(value.items()), True, True])
+            yield "{"
+        elif isinstance(value, (list, tuple)):
+            if len(stack) >= MAX_DEPTH:
+                raise ValueError("JSON nesting deeper than %d" % MAX_DEPTH)
+            stack.append([iter(value), False, True])
+            yield "["
+        else:
+            yield _encode_scalar(value)
+        #find the next value, closing any exhausted containers
+        while stack:
+            frame = stack[-1]
+            try:
+                item = next(frame[0])
+            except StopIteration:
+                stack.pop()
+                yield "}" if frame[1] else "]"
+                continue
+            sep = "" if frame[2] else ", "
+            frame[2] = False
+            if frame[1]:
+                key, value = item
+                yield sep + _encode_key(key) + ": "
+            else:
+                value = item
+                if sep:
+                    yield sep
+            break
+        else:
+            return
+
+def iter_encode(obj, chunksize = ENCODE_CHUNKSIZE):
+    """ yield the JSON text of obj coalesced into chunks of about chunksize
+        characters, at least one chunk is always produced
+    """
+    buff = []
+    size = 0
+    for frag in iter_fragments(obj):
+        buff.append(frag)
+        size += len(frag)
+        if size >= chunksize:
+            yield "".join(buff)
+            buff = []
+            size = 0
+    if buff:
+        yield "".join(buff)
+
+def dump(obj, stream, chunksize = ENCODE_CHUNKSIZE):
+    for chunk in iter_encode(obj, chunksize = chunksize):
+        stream.write(chunk)
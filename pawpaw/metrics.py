@@ -0,0 +1,133 @@
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ucollections import OrderedDict #micropython specific
+
+from .sys_tools import ticks_us, ticks_diff
+
+#upper bounds of the latency histogram buckets in microseconds, there is an
+#implicit final +Inf bucket
+DEFAULT_BUCKETS_US = (1000, 2500, 5000, 10000, 25000, 50000,
+                      100000, 250000, 500000, 1000000, 2500000)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4'
+################################################################################
+# Classes
+
+#-------------------------------------------------------------------------------
+# RequestMonitor - the hook interface which HttpServer calls while it handles
+#                  each request, subclasses override whichever they need
+class RequestMonitor(object):
+    def request_begin(self):
+        #a connection was just accepted
+        pass
+    def phase_begin(self, phase):
+        #phase is one of 'accept', 'read', 'lookup' or 'handle'
+        pass
+    def request_end(self, route):
+        #route is the registry key of the handler, or None if none was found
+        pass
+    def count(self, event):
+        #event is one of 'timeout', 'malformed', 'rejected', 'shed' or
+        #'exception'
+        pass
+    def gc_begin(self):
+        #the server is about to run a garbage collection
+        pass
+    def gc_end(self):
+        pass
+
+#-------------------------------------------------------------------------------
+class Histogram(object):
+    def __init__(self, bounds = DEFAULT_BUCKETS_US):
+        self.bounds = bounds
+        self.counts = [0]*(len(bounds) + 1) #per bucket, NOT cumulative
+        self.count  = 0
+        self.total  = 0
+
+    def observe(self, value):
+        i = 0
+        for bound in self.bounds:
+            if value <= bound:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += value
+
+#-------------------------------------------------------------------------------
+# Metrics - per phase and per route latency histograms plus event counters,
+#           recording costs a clock read and a short bucket scan per phase
+class Metrics(RequestMonitor):
+    PHASES = ('accept', 'read', 'lookup', 'handle')
+    EVENTS = ('timeout', 'malformed', 'rejected', 'shed', 'exception')
+    EVENT_METRIC_NAMES = {
+        'timeout'  : 'pawpaw_timeouts_total',
+        'malformed': 'pawpaw_malformed_requests_total',
+        'rejected' : 'pawpaw_rejected_requests_total',
+        'shed'     : 'pawpaw_shed_requests_total',
+        'exception': 'pawpaw_exceptions_total',
+    }
+
+    def __init__(self, bounds = DEFAULT_BUCKETS_US):
+        self.bounds = bounds
+        self.phases = OrderedDict((p, Histogram(bounds)) for p in self.PHASES)
+        self.routes = OrderedDict()
+        self.counters = OrderedDict((e, 0) for e in self.EVENTS)
+        self.requests = 0
+        self._phase = None
+        self._t_phase   = 0
+        self._t_request = 0
+
+    def request_begin(self):
+        self._t_request = self._t_phase = ticks_us()
+        self._phase = 'accept'
+
+    def phase_begin(self, phase):
+        now = ticks_us()
+        self.phases[self._phase].observe(ticks_diff(now, self._t_phase))
+        self._phase = phase
+        self._t_phase = now
+
+    def request_end(self, route):
+        now = ticks_us()
+        self.phases[self._phase].observe(ticks_diff(now, self._t_phase))
+        self.requests += 1
+        if not route is None:
+            hist = self.routes.get(route)
+            if hist is None:
+                self.routes[route] = hist = Histogram(self.bounds)
+            hist.observe(ticks_diff(now, self._t_request))
+
+    def count(self, event):
+        self.counters[event] += 1
+
+    def gen_prometheus(self):
+        #yields the Prometheus text exposition format, one metric per chunk
+        yield "# TYPE pawpaw_requests_total counter\n"
+        yield "pawpaw_requests_total %d\n" % self.requests
+        for event, n in self.counters.items():
+            name = self.EVENT_METRIC_NAMES[event]
+            yield "# TYPE %s counter\n" % name
+            yield "%s %d\n" % (name, n)
+        yield "# TYPE pawpaw_phase_duration_seconds histogram\n"
+        for phase, hist in self.phases.items():
+            yield _format_histogram("pawpaw_phase_duration_seconds", 'phase', phase, hist)
+        yield "# TYPE pawpaw_route_duration_seconds histogram\n"
+        for route, hist in self.routes.items():
+            yield _format_histogram("pawpaw_route_duration_seconds", 'route', route, hist)
+
+def _escape_label(value):
+    return str(value).replace('\\','\\\\').replace('"','\\"').replace('\n','\\n')
+
+def _format_histogram(name, label, value, hist):
+    label = '%s="%s"' % (label, _escape_label(value))
+    buff = []
+    cumulative = 0
+    for bound, n in zip(hist.bounds, hist.counts):
+        cumulative += n
+        buff.append('%s_bucket{%s,le="%g"} %d\n' % (name, label, bound/1000000, cumulative))
+    buff.append('%s_bucket{%s,le="+Inf"} %d\n' % (name, label, hist.count))
+    buff.append('%s_sum{%s} %g\n' % (name, label, hist.total/1000000))
+    buff.append('%s_count{%s} %d\n' % (name, label, hist.count))
+    return "".join(buff)
@@ -0,0 +1,57 @@
+# Middleware wraps the route handlers of a WebApp.  The chain is composed once
+# per handler when the app is constructed, into nested closures, so a request
+# only pays for the calls of the middleware that actually do something, e.g.
+#
+#     class RequireToken(Middleware):
+#         def before(self, context):
+#             if context.request.args.get("token") != [TOKEN]:
+#                 context.render_template(Template(text="forbidden"), status=403)
+#                 return True #short-circuit, the handler is skipped
+#             return False
+#
+#     @Router
+#     class App(WebApp):
+#         middleware = (RequireToken(),)
+
+################################################################################
+# Classes
+class Middleware(object):
+    def before(self, context):
+        #runs ahead of the handler, return True once a response has been sent
+        #to skip the handler (and any inner middleware)
+        return False
+
+    def after(self, context):
+        #runs once the handler has returned, unless it raised
+        pass
+
+    def wrap(self, handler, route):
+        #returns the handler wrapped in this middleware, route is the registry
+        #key of the handler, override for full control over the call
+        before = self.before if type(self).before != Middleware.before else None
+        after  = self.after  if type(self).after  != Middleware.after  else None
+        if before is None and after is None:
+            return handler
+        if after is None:
+            def handler_before(context):
+                if not before(context):
+                    handler(context)
+            return handler_before
+        if before is None:
+            def handler_after(context):
+                handler(context)
+                after(context)
+            return handler_after
+        def handler_both(context):
+            if before(context):
+                return
+            handler(context)
+            after(context)
+        return handler_both
+
+def compose(handler, route, middleware):
+    #the first middleware is the outermost, its `before` runs first and its
+    #`after` runs last
+    for mw in reversed(middleware):
+        handler = mw.wrap(handler, route)
+    return handler
@@ -0,0 +1,238 @@
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ucollections import OrderedDict #micropython specific
+
+from .http_connection_reader import FORM_MULTIPART
+
+# Streaming multipart/form-data parser for uploads.  HttpConnectionReader
+# leaves a multipart body on the connection (request.stream, with
+# request.content_length), and a handler walks its parts:
+#     for part in MultipartReader(context.request):
+#         if part.filename is None:
+#             fields[part.name] = part.text()
+#         else:
+#             part.save("/upload.bin") #in blocks, straight from the buffer
+# All the parsing happens in one fixed size buffer, so an upload of any size
+# takes constant memory.  A part is only readable until the next one is
+# asked for, what is left of it is skipped.
+
+BUFFER_SIZE = 512 #bytes, also the longest part header line accepted
+
+################################################################################
+# Exceptions
+class MultipartError(ValueError):
+    pass
+
+#-------------------------------------------------------------------------------
+def parse_boundary(content_type):
+    #the boundary of a multipart/form-data Content-Type as bytes, else None
+    if content_type is None:
+        return None
+    params = content_type.split(';')
+    if params[0].strip() != FORM_MULTIPART:
+        return None
+    for param in params[1:]:
+        key, _, val = param.partition('=')
+        if key.strip().lower() == 'boundary':
+            val = val.strip().strip('"')
+            if val:
+                return bytes(val, 'utf8')
+    return None
+
+def parse_disposition(value):
+    #'form-data; name="f"; filename="a.txt"' -> {'name': 'f', 'filename': 'a.txt'}
+    params = {}
+    for param in value.split(';')[1:]:
+        key, _, val = param.partition('=')
+        val = val.strip()
+        if len(val) >= 2 and val[0] == '"' and val[-1] == '"':
+            val = val[1:-1]
+        params[key.strip().lower()] = val
+    return params
+
+if hasattr(bytearray, 'find'):
+    def _find(buff, sub, start, end):
+        return buff.find(sub, start, end)
+else: #micropython bytearrays have no find, search a copy of the window
+    def _find(buff, sub, start, end):
+        pos = bytes(memoryview(buff)[start:end]).find(sub)
+        if pos < 0:
+            return pos
+        return pos + start
+
+################################################################################
+# Classes
+class Part(object):
+    def __init__(self, reader, headers):
+        self._reader = reader
+        self.headers = headers #OrderedDict of the part headers
+        disposition = parse_disposition(headers.get('Content-Disposition', ''))
+        self.name     = disposition.get('name')
+        self.filename = disposition.get('filename') #None for plain fields
+        self.content_type = headers.get('Content-Type', 'text/plain')
+
+    def _read_chunk(self, limit):
+        if not self._reader._part is self: #the reader has moved on
+            return None
+        return self._reader._read_chunk(limit)
+
+    def readinto(self, buff):
+        #fills buff with the next bytes of the part, returns 0 at its end
+        chunk = self._read_chunk(len(buff))
+        if chunk is None:
+            return 0
+        n = len(chunk)
+        buff[:n] = chunk
+        return n
+
+    def read(self, size = -1):
+        #the next size bytes of the part, or all of it, b"" at its end
+        buff = []
+        while size:
+            chunk = self._read_chunk(BUFFER_SIZE if size < 0 else size)
+            if chunk is None:
+                break
+            buff.append(bytes(chunk))
+            if size > 0:
+                size -= len(chunk)
+        return b"".join(buff)
+
+    def text(self):
+        return str(self.read(), 'utf8')
+
+    def save(self, f):
+        #writes the rest of the part to a file object, or to a new file of
+        #that name, a buffer at a time with no copy, returns the bytes written
+        if isinstance(f, str):
+            with open(f, 'wb') as fobj:
+                return self.save(fobj)
+        count = 0
+        while True:
+            chunk = self._read_chunk(BUFFER_SIZE)
+            if chunk is None:
+                return count
+            f.write(chunk)
+            count += len(chunk)
+
+class MultipartReader(object):
+    def __init__(self, request, buffer_size = BUFFER_SIZE):
+        boundary = parse_boundary(request.headers.get('Content-Type'))
+        if boundary is None or request.stream is None:
+            raise MultipartError("not a multipart/form-data request")
+        self._stream    = request.stream
+        self._remaining = request.content_length #None reads to the end
+        self._delim     = b"\r\n--" + boundary
+        #room for a delimiter split across two reads and then some
+        self._buff = bytearray(max(buffer_size, 4*len(self._delim)))
+        self._mv   = memoryview(self._buff)
+        #the body is read as if it began with CRLF, so that the first boundary
+        #looks like every other delimiter
+        self._buff[0:2] = b"\r\n"
+        self._start = 0 #the unread data is _buff[_start:_end]
+        self._end   = 2
+        self._eof   = False
+        self._part  = None
+        self._done  = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        part = self.next_part()
+        if part is None:
+            raise StopIteration
+        return part
+
+    def next_part(self):
+        #skips what is left of the current part (the preamble at first), then
+        #returns the next one or None after the closing delimiter
+        if self._done:
+            return None
+        self._part = None
+        while not self._read_chunk(len(self._buff)) is None:
+            pass
+        self._start += len(self._delim)
+        #"--" after the delimiter ends the body, else CRLF and headers follow
+        if self._readline().startswith(b"--"):
+            self._done = True
+            return None
+        headers = OrderedDict()
+        while True:
+            line = self._readline()
+            if not line:
+                break
+            try:
+                key, val = str(line, 'utf8').split(':', 1)
+            except ValueError:
+                raise MultipartError("malformed part header line")
+            headers[key.strip()] = val.strip()
+        self._part = part = Part(self, headers)
+        return part
+
+    def _fill(self):
+        #moves the unread data to the front of the buffer and reads more after
+        #it, returns False at the end of the body
+        start, end = self._start, self._end
+        n = end - start
+        mv = self._mv
+        if start:
+            #in steps no longer than start, so source and destination never
+            #overlap within one copy
+            pos = 0
+            while pos < n:
+                step = min(start, n - pos)
+                mv[pos:pos + step] = mv[start + pos:start + pos + step]
+                pos += step
+            self._start = 0
+            self._end = end = n
+        if self._eof:
+            return False
+        want = len(self._buff) - n
+        if want <= 0:
+            raise MultipartError("part header line over %d bytes" % len(self._buff))
+        if not self._remaining is None:
+            want = min(want, self._remaining)
+        count = 0
+        if want:
+            count = self._stream.readinto(mv[n:n + want])
+        if not count:
+            self._eof = True
+            return False
+        if not self._remaining is None:
+            self._remaining -= count
+        self._end = n + count
+        return True
+
+    def _read_chunk(self, limit):
+        #a memoryview into the buffer of at most limit bytes of the current
+        #part, None once its closing delimiter is reached
+        delim = self._delim
+        while True:
+            start, end = self._start, self._end
+            pos = _find(self._buff, delim, start, end)
+            if pos >= 0:
+                avail = pos
+            else: #the tail may hold the beginning of a delimiter
+                avail = max(start, end - len(delim) + 1)
+            if avail > start:
+                n = min(avail - start, limit)
+                self._start = start + n
+                return self._mv[start:start + n]
+            if pos >= 0:
+                return None
+            if not self._fill():
+                raise MultipartError("body ended before the closing delimiter")
+
+    def _readline(self):
+        #the next line without its CRLF, what is left at the end of the body
+        while True:
+            start, end = self._start, self._end
+            pos = _find(self._buff, b"\r\n", start, end)
+            if pos >= 0:
+                self._start = pos + 2
+                return bytes(self._mv[start:pos])
+            if not self._fill():
+                line = bytes(self._mv[self._start:self._end])
+                self._start = self._end
+                return line
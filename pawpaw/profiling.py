@@ -0,0 +1,107 @@
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ucollections import OrderedDict #micropython specific
+
+try:
+    from io import StringIO
+except ImportError:
+    from uio import StringIO
+
+try:
+    import cProfile, pstats
+except ImportError: #micropython, fall back to timing with ticks_us only
+    cProfile = None
+
+from .sys_tools import ticks_us, ticks_diff
+from .middleware import Middleware
+
+DEFAULT_SAMPLE_RATE = 0.1
+DEFAULT_REPORT_LIMIT = 15  #functions listed per route from the cProfile stats
+################################################################################
+# Classes
+class RouteProfile(object):
+    def __init__(self, route):
+        self.route = route
+        self.reset()
+
+    def reset(self):
+        #clears the counts and starts a new profile
+        self.calls   = 0 #all invocations
+        self.samples = 0 #profiled invocations
+        self.total_us = 0
+        self.max_us   = 0
+        self.profile = None
+        if not cProfile is None:
+            #one profile per route, it accumulates over all the samples
+            self.profile = cProfile.Profile()
+
+    def run(self, handler, context):
+        t0 = ticks_us()
+        try:
+            if self.profile is None:
+                return handler(context)
+            return self.profile.runcall(handler, context)
+        finally:
+            dt = ticks_diff(ticks_us(), t0)
+            self.samples += 1
+            self.total_us += dt
+            if dt > self.max_us:
+                self.max_us = dt
+
+    def gen_report(self, limit = DEFAULT_REPORT_LIMIT):
+        mean_us = self.total_us // self.samples if self.samples else 0
+        yield "%r:\n" % (self.route,)
+        yield "    calls: %d\n" % self.calls
+        yield "    samples: %d\n" % self.samples
+        yield "    mean_us: %d\n" % mean_us
+        yield "    max_us: %d\n" % self.max_us
+        if not self.profile is None and self.samples:
+            sfile = StringIO()
+            stats = pstats.Stats(self.profile, stream = sfile)
+            stats.sort_stats('cumulative').print_stats(limit)
+            sfile.seek(0,0)
+            yield "    cProfile: |\n" #this starts a multiline literal block
+            for line in sfile:
+                yield "        " + line
+            sfile.close()
+
+#-------------------------------------------------------------------------------
+# RouteProfiler - wraps route handlers so that every Nth invocation (N being
+#                 1/sample_rate) is profiled, under cProfile on CPython and
+#                 timed with ticks_us on micropython, aggregated per route
+class RouteProfiler(Middleware):
+    def __init__(self, sample_rate = DEFAULT_SAMPLE_RATE):
+        #sampling is deterministic, random is not available on every port
+        self.period = max(1, int(round(1.0 / sample_rate)))
+        self.routes = OrderedDict()
+
+    def wrap(self, handler, route):
+        prof = self.routes.get(route)
+        if prof is None:
+            self.routes[route] = prof = RouteProfile(route)
+        period = self.period
+        def sampled_handler(context):
+            prof.calls += 1
+            if prof.calls % period:
+                return handler(context)
+            return prof.run(handler, context)
+        return sampled_handler
+
+    def reset(self):
+        #in place, the wrapped handlers hold on to their RouteProfile
+        for prof in self.routes.values():
+            prof.reset()
+
+    def gen_report(self, limit = DEFAULT_REPORT_LIMIT):
+        #yields a YAML document with one entry per route
+        yield "SampleEvery: %d\n" % self.period
+        yield "Routes:\n"
+        for prof in self.routes.values():
+            for line in prof.gen_report(limit = limit):
+                yield "    " + line
+
+    def dump(self, filename, limit = DEFAULT_REPORT_LIMIT):
+        with open(filename, 'w') as f:
+            for chunk in self.gen_report(limit = limit):
+                f.write(chunk)
@@ -0,0 +1,109 @@
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ucollections import OrderedDict #micropython specific
+
+from .sys_tools import ticks_ms, ticks_diff
+
+# Caches the complete framed responses (status line, headers and body, chunk
+# framing included) of GET routes registered with `@route(cache_ttl=...)`.  A
+# hit is replayed with a single write, skipping the handler and any template
+# rendering.  Entries are keyed by path and raw query string and expire after
+# their ttl; once the byte budget is exceeded the least recently used go first.
+
+DEFAULT_BUDGET = 8192 #bytes of cached responses
+
+################################################################################
+# Classes
+class _CaptureFile(object):
+    #passes the writes through to wfile while keeping a copy, up to limit bytes
+    def __init__(self, wfile, limit):
+        self._wfile = wfile
+        self.parts = []
+        self.size  = 0
+        self.limit = limit
+
+    def write(self, data):
+        parts = self.parts
+        if not parts is None:
+            self.size += len(data)
+            if self.size > self.limit:
+                self.parts = None #too big to cache, stop copying
+            else:
+                parts.append(bytes(data))
+        return self._wfile.write(data)
+
+    def flush(self):
+        self._wfile.flush() #AttributeError on micropython, the writer handles it
+
+class ResponseCache(object):
+    def __init__(self, budget = DEFAULT_BUDGET):
+        self.budget = budget
+        self.size = 0
+        #key -> (stored ticks_ms, ttl_ms, response bytes), in LRU order
+        self.entries = OrderedDict()
+        self.hits   = 0
+        self.misses = 0
+
+    def wrap(self, handler, route, ttl):
+        #returns handler caching its GET responses for ttl seconds
+        ttl_ms = int(ttl*1000)
+        def cached_handler(context):
+            request = context.request
+            if request.method != "GET":
+                return handler(context)
+            key = request.path
+            if request.query:
+                key = key + "?" + request.query
+            data = self.get(key)
+            if not data is None:
+                self.hits += 1
+                context._conn_wfile.write(data)
+                context._flush()
+                return
+            self.misses += 1
+            wfile = context._conn_wfile
+            capture = _CaptureFile(wfile, self.budget)
+            context._conn_wfile = capture
+            try:
+                handler(context)
+            finally:
+                context._conn_wfile = wfile
+            if not capture.parts is None:
+                self.put(key, b"".join(capture.parts), ttl_ms)
+        return cached_handler
+
+    def get(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return None
+        t0, ttl_ms, data = entry
+        if ticks_diff(ticks_ms(), t0) >= ttl_ms:
+            self.size -= len(data)
+            return None
+        self.entries[key] = entry #reinsert as most recently used
+        return data
+
+    def put(self, key, data, ttl_ms):
+        #only successful responses are kept
+        if data[data.find(b" ") + 1:][:3] != b"200":
+            return
+        old = self.entries.pop(key, None)
+        if not old is None:
+            self.size -= len(old[2])
+        self.entries[key] = (ticks_ms(), ttl_ms, data)
+        self.size += len(data)
+        while self.size > self.budget:
+            lru = next(iter(self.entries))
+            self.size -= len(self.entries.pop(lru)[2])
+
+    def invalidate(self, path):
+        #drops the entries of path, for every query string
+        prefix = path + "?"
+        for key in list(self.entries.keys()):
+            if key == path or key.startswith(prefix):
+                self.size -= len(self.entries.pop(key)[2])
+
+    def clear(self):
+        self.entries = OrderedDict()
+        self.size = 0
@@ -0,0 +1,118 @@
+try:
+    import os
+except ImportError:
+    import uos as os #micropython specific
+
+from .http_connection_writer import MIME_TYPES, DEFAULT_MIME_TYPE, status_line, error_response
+
+# A directory served under a URL prefix, see `WebApp.mount_static`.  The
+# directory is scanned once into an index of URL path -> StaticEntry holding
+# everything a response needs, the encoded headers included, so serving a file
+# is a dict lookup, one write of the headers and the file copied through a
+# reused buffer.  A file `name.gz` next to `name` is sent instead to clients
+# accepting gzip, one found alone is served as `name` to every client.  Call
+# `WebApp.refresh_static` after the files change.
+
+CHUNKSIZE = 512 #bytes, the buffer files are copied through
+
+_S_IFDIR = 0x4000
+
+################################################################################
+# Classes
+class StaticEntry(object):
+    __slots__ = ('filename', 'size', 'mtime', 'mime_type', 'etag',
+                 'head', 'gz_filename', 'gz_head', 'not_modified')
+
+    def __init__(self, mime_type):
+        self.mime_type = mime_type
+        self.filename = self.size = self.mtime = self.etag = None
+        self.head = self.gz_filename = self.gz_head = self.not_modified = None
+
+    def finish(self):
+        #encodes the response heads once the variants are known
+        self.etag = '"%x-%x"' % (self.size, self.mtime)
+        common = "Content-Type: %s\r\nETag: %s\r\n" % (self.mime_type, self.etag)
+        if not self.gz_filename is None:
+            common += "Vary: Accept-Encoding\r\n"
+        self.not_modified = status_line(304) + bytes("ETag: %s\r\n\r\n" % self.etag, 'utf8')
+        if not self.filename is None:
+            self.head = status_line(200) + bytes("%sContent-Length: %d\r\n\r\n" %
+                                                 (common, self.size), 'utf8')
+        if not self.gz_filename is None:
+            gz_size = os.stat(self.gz_filename)[6]
+            self.gz_head = status_line(200) + bytes(
+                "%sContent-Encoding: gzip\r\nContent-Length: %d\r\n\r\n" %
+                (common, gz_size), 'utf8')
+
+class StaticFiles(object):
+    def __init__(self, prefix, directory, chunksize = CHUNKSIZE):
+        self.prefix    = prefix.rstrip("/") #"/" mounts at the root
+        self.directory = directory.rstrip("/")
+        self.entries   = {} #URL path -> StaticEntry
+        self.handler   = self.handle #replaced by the app, e.g. with middleware
+        self._buff     = bytearray(chunksize)
+
+    def scan(self):
+        #rebuilds the index from the files now in the directory
+        entries = {}
+        self._scan_dir(self.directory, self.prefix, entries)
+        for entry in entries.values():
+            entry.finish()
+        self.entries = entries
+        return entries
+
+    def _scan_dir(self, dirname, url_dir, entries):
+        for name in sorted(os.listdir(dirname)):
+            filename = dirname + "/" + name
+            st = os.stat(filename)
+            if st[0] & _S_IFDIR:
+                self._scan_dir(filename, url_dir + "/" + name, entries)
+                continue
+            gz = name.endswith(".gz")
+            if gz:
+                name = name[:-3]
+            path = url_dir + "/" + name
+            entry = entries.get(path)
+            if entry is None:
+                ext = name.split(".")[-1]
+                entry = StaticEntry(MIME_TYPES.get(ext, DEFAULT_MIME_TYPE))
+                entries[path] = entry
+            if gz:
+                entry.gz_filename = filename
+                if entry.filename is None: #a lone .gz stands for the file
+                    entry.size, entry.mtime = st[6], st[8]
+            else:
+                entry.filename = filename
+                entry.size, entry.mtime = st[6], st[8]
+            if name == "index.html":
+                entries[url_dir + "/"] = entry
+
+    def handle(self, context):
+        request = context.request
+        entry = self.entries.get(request.path)
+        w = context._conn_wfile.write
+        if entry is None: #removed by a refresh since the lookup
+            w(error_response(404))
+            context._flush()
+            return
+        headers = request.headers
+        etag = headers.get('If-None-Match')
+        if not etag is None and etag.strip() == entry.etag:
+            w(entry.not_modified)
+            context._flush()
+            return
+        filename, head = entry.filename, entry.head
+        if not entry.gz_filename is None:
+            accept = headers.get('Accept-Encoding')
+            if filename is None or (not accept is None and 'gzip' in accept):
+                filename, head = entry.gz_filename, entry.gz_head
+        buff = self._buff
+        mv = memoryview(buff)
+        with open(filename, 'rb') as f:
+            w(head)
+            while True:
+                count = f.readinto(buff)
+                if not count:
+                    break
+                w(mv[:count])
+        context._flush()
@@ -0,0 +1,23 @@
+import gc
+
+# Portable stand-ins for the micropython `time.ticks_*` counters and
+# `gc.mem_free`, shared by the modules timing requests or watching the heap.
+# On CPython the ticks never wrap, so `ticks_diff` is a plain subtraction.
+
+try:
+    from time import ticks_ms, ticks_us, ticks_diff #micropython specific
+except ImportError:
+    from time import time, perf_counter
+    def ticks_ms():
+        return int(time()*1000)
+    def ticks_us():
+        return int(perf_counter()*1000000)
+    def ticks_diff(end, start):
+        return end - start
+
+def mem_free():
+    #bytes of free heap, None where it is unbounded (CPython)
+    try:
+        return gc.mem_free() #micropython specific
+    except AttributeError:
+        return None
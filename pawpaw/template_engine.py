@@ -13,7 +13,9 @@ try:
 except ImportError: 
     from ucollections import OrderedDict #micrpython specific
     
-DEBUG = False
+from . import trace
+
+DEBUG = trace.DEBUG_ENABLED
     
 EXPRESSION_TAG_OPEN  = "{{"
 EXPRESSION_TAG_CLOSE = "}}"
@@ -141,7 +143,7 @@ class LazyTemplate(BaseTemplate):
             line = self._textio.readline()
             if line == "":
                 self.close()
-                raise StopIteration
+                return #NOTE raising StopIteration in a generator is an error since PEP 479
             self._line_num += 1
             #determine the indentation
             m = RE_INDENT.match(line)
@@ -177,7 +179,7 @@ class LazyTemplate(BaseTemplate):
             if tag_start_pos == -1: #no tags found
                 if line:  #prevent empty lines from being sent
                     yield line
-                raise StopIteration
+                return
             
             rep = self._tag_replacements.get(tag_name)
             if not rep is None:
@@ -227,6 +229,61 @@ class LazyTemplate(BaseTemplate):
     def from_text(cls, text, **kwargs):
         return cls(textio = StringIO(text), **kwargs)
         
+def splice(rep, tag):
+    #the encoded chunks a compiled template sends for one tag, `tag` is the
+    #tag text left in place when there is no replacement
+    if rep is None:
+        yield tag
+    elif isinstance(rep, bytes):
+        yield rep
+    elif isinstance(rep, str):
+        yield bytes(rep, 'utf8')
+    else:
+        try:
+            chunks = iter(rep)
+        except TypeError: #any other value is spliced in as text
+            yield bytes(str(rep), 'utf8')
+            return
+        #a generator or a nested template, spliced in chunk by chunk
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = bytes(chunk, 'utf8')
+            yield chunk
+
+class CompiledTemplate(BaseTemplate):
+    """  A template compiled ahead of time by tools/compile_templates.py into
+         a module of bytes literals and a `render(tag_replacements)` generator.
+    """
+    # Iterating yields encoded chunks which HttpConnectionWriter sends as they
+    # are, no file is opened and no tag is scanned at runtime.  A frozen
+    # module keeps its literals in flash.  The replacements may be strings,
+    # generators or other templates, nested lines are not re-indented and
+    # lines are sent exactly as in the source file.  Like LazyTemplate it can
+    # be iterated once.
+    def __init__(self, module, tag_replacements = None):
+        BaseTemplate.__init__(self, tag_replacements)
+        self._render_func = module.render
+        self.tags = module.TAGS
+        self._gen = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._gen is None: #formatted until the first chunk is asked for
+            self._gen = self._render_func(self._tag_replacements)
+        return next(self._gen)
+
+    def render(self):
+        return str(b"".join(self), 'utf8')
+
+    @classmethod
+    def from_module(cls, name, **kwargs):
+        #e.g. CompiledTemplate.from_module("pins_html"), the module is only
+        #imported on first use
+        module = __import__(name, None, None, ['render'])
+        return cls(module, **kwargs)
+
 ################################################################################
 # TEST CODE
 ################################################################################
@@ -0,0 +1,79 @@
+import sys
+
+# Leveled tracing for the pawpaw modules.  The level is fixed once, at import
+# time, and every module copies the flags below into its own constants which
+# guard the trace calls, so a disabled level never formats a message and costs
+# a single global lookup on the hot paths.  Set the level before importing
+# pawpaw, either with a `pawpaw_config.py` module on the path defining
+# TRACE_LEVEL, or with the PAWPAW_TRACE_LEVEL environment variable.  Running
+# optimized (python -O, micropython -O or mpy-cross -O1) forces it to 'none'.
+
+NONE    = 0
+ERROR   = 1
+WARNING = 2
+INFO    = 3
+DEBUG   = 4
+
+LEVEL_NAMES = ('none', 'error', 'warning', 'info', 'debug')
+DEFAULT_LEVEL = WARNING
+
+def parse_level(value):
+    #accepts a level number or its name
+    if isinstance(value, int):
+        return value
+    value = value.strip().lower()
+    if value in LEVEL_NAMES:
+        return LEVEL_NAMES.index(value)
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError("unknown trace level '%s'" % value)
+
+def _configured_level():
+    try:
+        from pawpaw_config import TRACE_LEVEL
+        return parse_level(TRACE_LEVEL)
+    except ImportError:
+        pass
+    try:
+        import os
+        value = os.getenv("PAWPAW_TRACE_LEVEL")
+    except (ImportError, AttributeError): #not on every micropython port
+        value = None
+    if value:
+        return parse_level(value)
+    return DEFAULT_LEVEL
+
+if __debug__:
+    LEVEL = _configured_level()
+else:
+    LEVEL = NONE
+
+ERROR_ENABLED   = LEVEL >= ERROR
+WARNING_ENABLED = LEVEL >= WARNING
+INFO_ENABLED    = LEVEL >= INFO
+DEBUG_ENABLED   = LEVEL >= DEBUG
+
+def _emit(level, msg, args):
+    if args:
+        msg = msg % args
+    out = sys.stderr if level <= WARNING else sys.stdout
+    print("%s: %s" % (LEVEL_NAMES[level].upper(), msg), file = out)
+
+# these format `msg % args` only when the level is enabled, hot paths should
+# still test the *_ENABLED flag first to skip building the args too
+def error(msg, *args):
+    if ERROR_ENABLED:
+        _emit(ERROR, msg, args)
+
+def warning(msg, *args):
+    if WARNING_ENABLED:
+        _emit(WARNING, msg, args)
+
+def info(msg, *args):
+    if INFO_ENABLED:
+        _emit(INFO, msg, args)
+
+def debug(msg, *args):
+    if DEBUG_ENABLED:
+        _emit(DEBUG, msg, args)
@@ -78,10 +78,17 @@ def _coerce_args(*args):
 #_hexdig = '0123456789ABCDEFabcdef'
 #_hextobyte = {(a + b).encode(): bytes([int(a + b, 16)])
 #              for a in _hexdig for b in _hexdig}
-def _hextobyte(hexdigs):
-    # CWV the above implemntation takes too much heap memory (1784 bytes)
-    # a function should be much more compact
-    return bytes([int(hexdigs.decode('utf-8'),16)])
+# CWV the above implemntation takes too much heap memory (1784 bytes)
+# instead index a 256 byte table by the raw byte to get its hex digit value,
+# 0xFF marks a non-hex byte
+def _make_hexvals():
+    table = bytearray(b'\xff' * 256)
+    for i, c in enumerate(b'0123456789abcdef'):
+        table[c] = i
+    for i, c in enumerate(b'ABCDEF'):
+        table[c] = 10 + i
+    return bytes(table)
+_hexvals = _make_hexvals()
 
 def unquote_to_bytes(string):
     # Note: strings are encoded as UTF-8. This is only an issue if it contains
@@ -95,18 +102,33 @@ def unquote_to_bytes(string):
     bits = string.split(b'%')
     if len(bits) == 1:
         return string
-    res = [bits[0]]
+    #the literal runs come from the split, the two digits after each '%' are
+    #two table lookups instead of a str, an int and a bytes object
+    hexvals = _hexvals
+    res = bytearray(bits[0])
     append = res.append
+    extend = res.extend
     for item in bits[1:]:
-        try:
-            append(_hextobyte(item[:2]))
-            append(item[2:])
-        except KeyError:
-            append(b'%')
-            append(item)
-    return b''.join(res)
+        if len(item) > 1:
+            hi = hexvals[item[0]]
+            lo = hexvals[item[1]]
+            if hi < 16 and lo < 16:
+                append((hi << 4) | lo)
+                extend(item[2:])
+                continue
+        #not an escape, keep the '%' as is
+        append(0x25)
+        extend(item)
+    return bytes(res)
+
+_asciire = None #compiled on first use, like the _*prog regexes below
 
-_asciire = re.compile(r'([\x00-\x7f]+)')
+def _get_asciire():
+    #the regex splitting runs of ASCII chars out of a string
+    global _asciire
+    if _asciire is None:
+        _asciire = re.compile(r'([\x00-\x7f]+)')
+    return _asciire
 
 def unquote(string, encoding='utf-8', errors='replace'):
     if '%' not in string:
@@ -116,7 +138,11 @@ def unquote(string, encoding='utf-8', errors='replace'):
         encoding = 'utf-8'
     if errors is None:
         errors = 'replace'
-    bits = _asciire.split(string)
+    if encoding in ('utf-8', 'utf8', 'UTF-8'):
+        #any unescaped non-ASCII chars survive a round trip through UTF-8, so
+        #the whole string can be decoded in one pass
+        return unquote_to_bytes(string).decode(encoding, errors)
+    bits = _get_asciire().split(string)
     res = [bits[0]]
     append = res.append
     for i in range(1, len(bits), 2):
@@ -163,6 +189,101 @@ def parse_qsl(qs, keep_blank_values=False, strict_parsing=False,
             r.append((name, value))
     return r
 
+class LazyQueryDict(object):
+    # A read-only mapping equivalent to `parse_qs(qs)` which defers all the
+    # parsing until it is first used.  Looking up a single key with `get`,
+    # `[]` or `in` only decodes the names of the fields, and only the values
+    # of the matching fields, any other use parses the whole query once.
+    __slots__ = ('_qs', '_parsed', '_found')
+
+    def __init__(self, qs = ""):
+        self._qs = qs
+        self._parsed = None
+        self._found = None #per-key cache for lookups before a full parse
+
+    def reset(self, qs = ""):
+        #reuses the mapping for another query, see HttpRequest.reset
+        self._qs = qs
+        self._parsed = None
+        self._found = None
+
+    def _parse_all(self):
+        if self._parsed is None:
+            self._parsed = parse_qs(self._qs) if self._qs else {}
+            self._found = None
+        return self._parsed
+
+    def _scan_key(self, key):
+        #returns the list of values for key, or None if absent
+        if not self._parsed is None:
+            return self._parsed.get(key)
+        if not self._qs:
+            return None
+        found = self._found
+        if found is None:
+            self._found = found = {}
+        elif key in found:
+            return found[key]
+        values = None
+        for s1 in self._qs.split('&'):
+            for name_value in s1.split(';'):
+                nv = name_value.split('=', 1)
+                if len(nv) != 2 or not nv[1]:
+                    continue #blank values are dropped, as by parse_qs
+                name = nv[0]
+                if '+' in name or '%' in name:
+                    name = unquote_plus(name)
+                if name == key:
+                    if values is None:
+                        values = []
+                    values.append(unquote_plus(nv[1]))
+        found[key] = values
+        return values
+
+    def __getitem__(self, key):
+        values = self._scan_key(key)
+        if values is None:
+            raise KeyError(key)
+        return values
+
+    def get(self, key, default = None):
+        values = self._scan_key(key)
+        if values is None:
+            return default
+        return values
+
+    def get_first(self, key, default = None):
+        #the first value for key, rather than the list of all its values
+        values = self._scan_key(key)
+        if values is None:
+            return default
+        return values[0]
+
+    def __contains__(self, key):
+        return not self._scan_key(key) is None
+
+    def __iter__(self):
+        return iter(self._parse_all())
+
+    def __len__(self):
+        return len(self._parse_all())
+
+    def keys(self):
+        return self._parse_all().keys()
+
+    def values(self):
+        return self._parse_all().values()
+
+    def items(self):
+        return self._parse_all().items()
+
+    def __eq__(self, other):
+        return self._parse_all() == other
+
+    def __repr__(self):
+        #does not force a parse, so it is cheap to log
+        return "LazyQueryDict(%r)" % (self._qs,)
+
 def unquote_plus(string, encoding='utf-8', errors='replace'):
     string = string.replace('+', ' ')
     return unquote(string, encoding, errors)
@@ -4,8 +4,9 @@ try:
     import sys
     from sys import print_exception #micropython specific
 except ImportError:
-    import traceback
-    print_exception = lambda exc, file_: traceback.print_exc(file=file_)
+    def print_exception(exc, file_):
+        import traceback #CPython, deferred until an exception is printed
+        traceback.print_exc(file=file_)
     
 try:
     import re
@@ -24,11 +25,17 @@ except ImportError:
 
 from .http_server     import HttpServer
 from .template_engine import Template, LazyTemplate
+from . import trace
+#the optional features (metrics, middleware, response_cache, websocket and
+#admission) are imported only once an app uses them, keeping boot time and heap
+#down on small boards
 
-DEBUG = True
+DEBUG = trace.DEBUG_ENABLED
 DEFAULT_LOG_DIR      = "logs"
 DEFAULT_LOG_FILENAME = "WebApp.yaml"
 LOG_FILESIZE_LIMIT   = 2**20 #1MB
+DEFAULT_METRICS_PATH = "/metrics"
+DEFAULT_PROFILE_PATH = "/profile"
 ################################################################################
 # DECORATORS
 #-------------------------------------------------------------------------------
@@ -37,8 +44,14 @@ LOG_FILESIZE_LIMIT   = 2**20 #1MB
 class route(object):
     registered_paths  = OrderedDict()
     registered_regexs = OrderedDict()
+    #per route options, registered_options[req_method][path or repr(regex)]
+    registered_options = OrderedDict()
 
-    def __init__(self, path = None, regex = None, methods = None):
+    def __init__(self, path = None, regex = None, methods = None,
+                 cache_ttl = None, #seconds to replay the cached GET response
+                 websocket = False, #handler(ws, message) of a WebSocket route
+                 priority = None, #for admission control, see pawpaw.admission
+                 ):
         #this runs upon decoration
         self.path = path
         if not regex is None and not hasattr(regex, "match"):
@@ -47,6 +60,13 @@ class route(object):
         if methods is None:
             methods = ["GET"]
         self.req_methods = methods
+        self.options = OrderedDict()
+        if not cache_ttl is None:
+            self.options['cache_ttl'] = cache_ttl
+        if websocket:
+            self.options['websocket'] = True
+        if not priority is None:
+            self.options['priority'] = priority
         
     def __call__(self, func):
         #this runs upon decoration immediately after __init__
@@ -68,6 +88,15 @@ class route(object):
                 if DEBUG:
                     print("@route REGISTERING REGEX HANDLER in registered_regexs['%s']['%s'] as func: %s" % (req_method,self.regex,func))
                 self.registered_regexs[req_method] = meth_regexs
+            #-------------------------------------------------------------------
+            # options, kept apart since micropython functions take no attributes
+            if self.options:
+                meth_options = self.registered_options.get(req_method,OrderedDict())
+                if not self.path is None:
+                    meth_options[self.path] = self.options
+                if not self.regex is None:
+                    meth_options[repr(self.regex)] = self.options
+                self.registered_options[req_method] = meth_options
         return func
 
 #-------------------------------------------------------------------------------
@@ -83,6 +112,7 @@ def Router(cls):
         #update the private class to contain all currently registered routes
         _unbound_path_handler_registry  = route.registered_paths.copy()
         _unbound_regex_handler_registry = route.registered_regexs.copy()
+        _route_options = route.registered_options.copy()
         def __init__(self,*args,**kwargs):
             def bind_method(m):
                 return (lambda *args2, **kwargs2: m(self,*args2,**kwargs2))
@@ -126,6 +156,7 @@ def Router(cls):
                         print("@Router BOUND HANDLER in regex_handler_registry['%s']['%s'] as func: %s" % (req_method,regex,handler))
                 rhr[req_method] = rhr_rm
             kwargs['regex_handler_registry'] = regex_handler_registry
+            kwargs['route_options'] = type(self)._route_options
             #-------------------------------------------------------------------
             #setup the log file
             kwargs['log_filename'] = log_filename
@@ -135,6 +166,7 @@ def Router(cls):
     #attribute space, this allows for independent routing WebApp instances
     route.registered_paths = OrderedDict()
     route.registered_regexs = OrderedDict()
+    route.registered_options = OrderedDict()
     return RouterWrapped
 
 ################################################################################
@@ -187,6 +219,9 @@ class Logger(object):
 # WebApp - a basic application which responds to HTTP requests over a socket
 #          interface.
 class WebApp(object):
+    #Middleware instances wrapped around every handler, the first outermost
+    middleware = ()
+    
     def __init__(self,
                  server_addr,
                  server_port,
@@ -195,6 +230,17 @@ class WebApp(object):
                  log_dir      = DEFAULT_LOG_DIR,
                  log_filename = DEFAULT_LOG_FILENAME,
                  socket_timeout = None,  #default is BLOCKING
+                 metrics = False,
+                 metrics_path = DEFAULT_METRICS_PATH,
+                 monitors = None,
+                 gc_policy = None,
+                 profiler = None,
+                 profile_path = DEFAULT_PROFILE_PATH,
+                 middleware = None, #overrides the class attribute
+                 route_options = None,
+                 cache_budget = None, #bytes, default response_cache.DEFAULT_BUDGET
+                 request_limits = None, #e.g. {'max_body': 4096}, see HttpConnectionReader
+                 admission = None, #an AdmissionControl to shed load by route priority
                 ):
         if DEBUG:
             print("INSIDE WebApp.__init__:")
@@ -213,9 +259,73 @@ class WebApp(object):
         self.path_handler_registry = path_handler_registry
         self.regex_handler_registry = regex_handler_registry
         self.log_filepath = "/".join((log_dir,log_filename))
+        if route_options is None:
+            route_options = OrderedDict()
+        self.route_options = route_options
+        self.static_mounts = [] #StaticFiles, see mount_static
+        get_options = route_options.get("GET", {})
+        #-----------------------------------------------------------------------
+        # websocket routes, their handlers take (ws, message) and are replaced
+        # by the handshake which is all that the wrappers below get to see
+        for key, options in get_options.items():
+            if options.get('websocket'):
+                from .websocket import upgrade_handler
+                self._wrap_handler("GET", key, upgrade_handler)
+        #-----------------------------------------------------------------------
+        # optional sampled profiling of the route handlers, a RouteProfiler
+        self.profiler = profiler
+        if not profiler is None:
+            self._wrap_handlers(profiler.wrap)
+            if not profile_path is None:
+                meth_paths = path_handler_registry.get("GET", OrderedDict())
+                meth_paths[profile_path] = self.handle_profile
+                path_handler_registry["GET"] = meth_paths
+        #-----------------------------------------------------------------------
+        # response caching of the GET routes registered with a cache_ttl, inside
+        # the middleware so that e.g. authentication still runs on every hit
+        self.response_cache = None
+        for key, options in get_options.items():
+            ttl = options.get('cache_ttl')
+            if ttl is None:
+                continue
+            if self.response_cache is None:
+                from .response_cache import ResponseCache, DEFAULT_BUDGET
+                if cache_budget is None:
+                    cache_budget = DEFAULT_BUDGET
+                self.response_cache = ResponseCache(budget = cache_budget)
+            self._wrap_handler("GET", key, self.response_cache.wrap, ttl)
+        #-----------------------------------------------------------------------
+        # optional request metrics, served in Prometheus text format along with
+        # those of any other monitors, e.g. a HeapMonitor
+        if monitors is None:
+            monitors = []
+        monitors = list(monitors)
+        self.metrics = None
+        if metrics:
+            if metrics is True:
+                from .metrics import Metrics
+                metrics = Metrics()
+            self.metrics = metrics
+            monitors.append(metrics)
+            if not metrics_path is None:
+                meth_paths = path_handler_registry.get("GET", OrderedDict())
+                meth_paths[metrics_path] = self.handle_metrics
+                path_handler_registry["GET"] = meth_paths
+        #-----------------------------------------------------------------------
+        # the middleware chain is composed into each handler here, once, so
+        # the built-in routes above are covered as well
+        if middleware is None:
+            middleware = self.middleware
+        self.middleware = middleware = tuple(middleware)
+        if middleware:
+            from .middleware import compose
+            self._wrap_handlers(lambda h, route: compose(h, route, middleware))
         
         addr = (self.server_addr, self.server_port)
-        self._server = HttpServer(addr,app=self,timeout=socket_timeout)
+        self._server = HttpServer(addr,app=self,timeout=socket_timeout,
+                                  monitors=monitors, gc_policy=gc_policy,
+                                  request_limits=request_limits,
+                                  admission=admission)
         
     def serve_forever(self):
         # Activate the server; this will keep running until you
@@ -232,6 +342,101 @@ class WebApp(object):
             print("context.request:\n%s" % context.request)
         context.send_file("html/404.html")
         
+    def _wrap_handlers(self, wrap):
+        #replaces every registered handler h with wrap(h, route) where route
+        #is its registry key, the same key that HttpServer.lookup_handler uses
+        for req_method, meth_paths in self.path_handler_registry.items():
+            if req_method == 'DEFAULT':
+                continue
+            for path in meth_paths.keys():
+                meth_paths[path] = wrap(meth_paths[path], path)
+        self.path_handler_registry['DEFAULT'] = wrap(self.path_handler_registry['DEFAULT'], 'DEFAULT')
+        for meth_regexs in self.regex_handler_registry.values():
+            for repr_regex in meth_regexs.keys():
+                regex, handler = meth_regexs[repr_regex]
+                meth_regexs[repr_regex] = (regex, wrap(handler, repr_regex))
+        
+    def _wrap_handler(self, req_method, route, wrap, *args):
+        #replaces the one handler registered under route with
+        #wrap(h, route, *args)
+        meth_paths = self.path_handler_registry.get(req_method, {})
+        if route in meth_paths:
+            meth_paths[route] = wrap(meth_paths[route], route, *args)
+            return
+        meth_regexs = self.regex_handler_registry.get(req_method, {})
+        if route in meth_regexs:
+            regex, handler = meth_regexs[route]
+            meth_regexs[route] = (regex, wrap(handler, route, *args))
+        
+    def mount_static(self, prefix, directory, **kwargs):
+        #serves the files under directory at prefix, e.g.
+        #app.mount_static("/static", "www"), indexed once here, routes
+        #registered with @route for the same paths take precedence
+        from .static_files import StaticFiles
+        mount = StaticFiles(prefix, directory, **kwargs)
+        if self.middleware:
+            from .middleware import compose
+            mount.handler = compose(mount.handle, mount.prefix, self.middleware)
+        self.static_mounts.append(mount)
+        self._register_static(mount)
+        return mount
+        
+    def refresh_static(self):
+        #rescans the mounted directories, after files were added or changed
+        meth_paths = self.path_handler_registry.get("GET", {})
+        for mount in self.static_mounts:
+            for path in mount.entries.keys():
+                if meth_paths.get(path) is mount.handler:
+                    del meth_paths[path]
+            self._register_static(mount)
+        
+    def _register_static(self, mount):
+        meth_paths = self.path_handler_registry.get("GET", OrderedDict())
+        for path in mount.scan().keys():
+            if not path in meth_paths:
+                meth_paths[path] = mount.handler
+        self.path_handler_registry["GET"] = meth_paths
+        
+    def route_priority(self, req_method, route):
+        from .admission import PRIORITY_NORMAL
+        options = self.route_options.get(req_method, {}).get(route)
+        if options is None:
+            return PRIORITY_NORMAL
+        return options.get('priority', PRIORITY_NORMAL)
+        
+    def broadcast(self, data, route = None):
+        #sends data to every open websocket, or only to those of route (the
+        #path or regex it was registered with)
+        if not route is None and hasattr(route, "match"):
+            route = repr(route)
+        from .websocket import broadcast
+        broadcast(self._server.websockets, data, route = route)
+        
+    def invalidate_cache(self, path = None):
+        #drops the cached responses of path, or all of them
+        if self.response_cache is None:
+            return
+        if path is None:
+            self.response_cache.clear()
+        else:
+            self.response_cache.invalidate(path)
+        
+    def handle_profile(self, context):
+        context.render_template(self.profiler.gen_report(),
+                                content_type='text/yaml')
+        
+    def dump_profile(self, filename):
+        self.profiler.dump(filename)
+        
+    def handle_metrics(self, context):
+        from .metrics import PROMETHEUS_CONTENT_TYPE
+        def gen_all():
+            for m in self._server.monitors:
+                if hasattr(m, "gen_prometheus"):
+                    for chunk in m.gen_prometheus():
+                        yield chunk
+        context.render_template(gen_all(), content_type=PROMETHEUS_CONTENT_TYPE)
+        
     def get_logger(self):
         return Logger(self.log_filepath, app = self)
         
@@ -0,0 +1,233 @@
+try:
+    import hashlib
+except ImportError:
+    import uhashlib as hashlib #micropython specific
+
+try:
+    import binascii
+except ImportError:
+    import ubinascii as binascii #micropython specific
+
+from .template_engine import Template
+from .http_connection_writer import status_line
+from . import trace
+
+# WebSocket (RFC 6455) connections for routes registered with
+# `@route(path=..., websocket=True)`.  The route's HTTP handler is replaced by
+# the handshake, after which HttpServer keeps the socket open and polls it along
+# with the listening socket.  The route handler is then called as
+# `handler(ws, message)`, once with message None when the connection opens and
+# again for every message received, a str for text and bytes for binary data.
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONT   = 0x0
+OP_TEXT   = 0x1
+OP_BINARY = 0x2
+OP_CLOSE  = 0x8
+OP_PING   = 0x9
+OP_PONG   = 0xA
+
+CLOSE_NORMAL       = 1000
+CLOSE_GOING_AWAY   = 1001
+CLOSE_PROTOCOL     = 1002
+CLOSE_TOO_BIG      = 1009
+CLOSE_SERVER_ERROR = 1011
+CLOSE_TRY_LATER    = 1013
+
+MAX_MESSAGE = 4096  #bytes, larger messages close the connection
+IO_TIMEOUT  = 5     #seconds to finish reading a frame once it has begun
+
+_HANDSHAKE_HEAD = (status_line(101) +
+                   b"Upgrade: websocket\r\n"
+                   b"Connection: Upgrade\r\n"
+                   b"Sec-WebSocket-Accept: ")
+
+def accept_key(key):
+    digest = hashlib.sha1(bytes(key + GUID, 'utf8')).digest()
+    return str(binascii.b2a_base64(digest), 'utf8').strip()
+
+def _header(request, name):
+    val = request.headers.get(name)
+    if val is None:
+        return ""
+    return val.strip()
+
+def upgrade_handler(handler, route):
+    #returns the HTTP handler performing the handshake for a websocket route,
+    #HttpServer takes over the connection once it finds context.upgrade set
+    def handle_upgrade(context):
+        request = context.request
+        key = _header(request, 'Sec-WebSocket-Key')
+        if not key or _header(request, 'Upgrade').lower() != 'websocket':
+            context.render_template(Template(text="expected a websocket upgrade"),
+                                    status = 400)
+            return
+        context._conn_wfile.write(_HANDSHAKE_HEAD +
+                                  bytes(accept_key(key) + "\r\n\r\n", 'utf8'))
+        context._flush()
+        context.upgrade = WebSocket(request, handler, route)
+    return handle_upgrade
+
+################################################################################
+# Classes
+class WebSocket(object):
+    def __init__(self, request, handler, route):
+        self.request = request #the upgrade request
+        self.handler = handler
+        self.route   = route
+        self.sock    = None
+        self.closed  = False
+        self._io     = None
+        self._fragments = None #payloads of a fragmented message
+        self._fragments_size = 0
+        self._fragments_opcode = OP_TEXT
+
+    def open(self, sock):
+        #called by HttpServer once the handshake response is sent
+        self.sock = sock
+        sock.settimeout(IO_TIMEOUT)
+        #unbuffered, so that polling the socket tells if a frame is waiting,
+        #on micropython makefile returns the socket itself
+        self._io = sock.makefile('rwb', 0)
+
+    def send(self, data):
+        if isinstance(data, str):
+            self._send_frame(OP_TEXT, bytes(data, 'utf8'))
+        else:
+            self._send_frame(OP_BINARY, data)
+
+    def ping(self, data = b""):
+        self._send_frame(OP_PING, data)
+
+    def close(self, code = CLOSE_NORMAL, reason = ""):
+        if self.closed:
+            return
+        payload = bytes((code >> 8, code & 0xFF)) + bytes(reason, 'utf8')
+        try:
+            self._send_frame(OP_CLOSE, payload)
+        except OSError:
+            pass #the peer is gone already
+        self.abort()
+
+    def abort(self):
+        #drops the connection without a closing handshake
+        if self.closed:
+            return
+        self.closed = True
+        if not self._io is None and not self._io is self.sock:
+            self._io.close()
+        self.sock.close()
+
+    def recv(self):
+        #reads one frame, returns the message it completes or None when it was
+        #a control frame or a fragment, see `closed` after a close frame
+        fin, opcode, payload = self._read_frame()
+        if payload is None:
+            return None #the connection was closed on a protocol error
+        if opcode == OP_PING:
+            self._send_frame(OP_PONG, payload)
+            return None
+        if opcode == OP_PONG:
+            return None
+        if opcode == OP_CLOSE:
+            code = CLOSE_NORMAL
+            if len(payload) >= 2:
+                code = (payload[0] << 8) | payload[1]
+            self.close(code) #echo it back to complete the closing handshake
+            return None
+        #data frames
+        if opcode == OP_CONT:
+            if self._fragments is None:
+                self.close(CLOSE_PROTOCOL)
+                return None
+        else:
+            if not self._fragments is None:
+                self.close(CLOSE_PROTOCOL)
+                return None
+            self._fragments = []
+            self._fragments_size = 0
+            self._fragments_opcode = opcode
+        self._fragments.append(payload)
+        self._fragments_size += len(payload)
+        if self._fragments_size > MAX_MESSAGE:
+            self.close(CLOSE_TOO_BIG)
+            return None
+        if not fin:
+            return None
+        data = b"".join(self._fragments)
+        self._fragments = None
+        if self._fragments_opcode == OP_TEXT:
+            return str(data, 'utf8')
+        return data
+
+    def _read_exact(self, n):
+        buff = bytearray(n)
+        mv = memoryview(buff)
+        pos = 0
+        while pos < n:
+            count = self._io.readinto(mv[pos:])
+            if not count:
+                raise OSError("websocket connection closed by peer")
+            pos += count
+        return buff
+
+    def _read_frame(self):
+        b0, b1 = self._read_exact(2)
+        fin    = bool(b0 & 0x80)
+        opcode = b0 & 0x0F
+        length = b1 & 0x7F
+        if not b1 & 0x80: #clients must mask every frame
+            self.close(CLOSE_PROTOCOL)
+            return fin, opcode, None
+        if length == 126:
+            b = self._read_exact(2)
+            length = (b[0] << 8) | b[1]
+        elif length == 127:
+            length = 0
+            for b in self._read_exact(8):
+                length = (length << 8) | b
+        if opcode >= OP_CLOSE and (length > 125 or not fin):
+            self.close(CLOSE_PROTOCOL)
+            return fin, opcode, None
+        if length > MAX_MESSAGE:
+            self.close(CLOSE_TOO_BIG)
+            return fin, opcode, None
+        mask = self._read_exact(4)
+        payload = self._read_exact(length)
+        for i in range(length):
+            payload[i] ^= mask[i & 3]
+        return fin, opcode, payload
+
+    def _send_frame(self, opcode, payload):
+        n = len(payload)
+        if n < 126:
+            head = bytes((0x80 | opcode, n))
+        elif n < 0x10000:
+            head = bytes((0x80 | opcode, 126, n >> 8, n & 0xFF))
+        else:
+            head = bytes([0x80 | opcode, 127] +
+                         [(n >> shift) & 0xFF for shift in range(56, -8, -8)])
+        self._write(head + payload)
+
+    def _write(self, data):
+        mv = memoryview(data)
+        pos = 0
+        while pos < len(data):
+            count = self._io.write(mv[pos:])
+            if count is None: #would block
+                count = 0
+            pos += count
+
+#-------------------------------------------------------------------------------
+def broadcast(websockets, data, route = None):
+    #sends data to each open websocket, of the given route only if not None,
+    #dropping those which fail
+    for ws in websockets:
+        if ws.closed or (not route is None and ws.route != route):
+            continue
+        try:
+            ws.send(data)
+        except OSError as exc:
+            trace.info("dropping websocket %s: %s", ws.route, exc)
+            ws.abort()
@@ -0,0 +1,124 @@
+# Precompiles the package with mpy-cross, so a board loads bytecode instead of
+# compiling the sources at boot, which costs both time and heap:
+#     python3 tools/build_mpy.py [--march xtensa] [--manifest]
+# The .mpy files go to build/mpy/pawpaw/ (copy that directory to the board's
+# /lib), the other package files (templates, test data) are copied alongside.
+# Optimization level 1 drops the asserts and fixes pawpaw.trace to level none,
+# see README "Tracing", use -O 0 to keep tracing.
+# --manifest also writes build/mpy/manifest.py, for freezing the package into
+# a firmware image with
+#     make BOARD=... FROZEN_MANIFEST=/path/to/build/mpy/manifest.py
+# frozen modules run from flash and take no heap for their bytecode at all.
+# Templates compiled by tools/compile_templates.py into build/templates/ are
+# included too, as top level modules.
+import os
+import sys
+import shutil
+import subprocess
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PACKAGE_DIR = os.path.join(_ROOT, 'pawpaw')
+BUILD_DIR   = os.path.join(_ROOT, 'build', 'mpy')
+TEMPLATES_DIR = os.path.join(_ROOT, 'build', 'templates')
+
+#directories left out of the bundle
+SKIP_DIRS = ('__pycache__',)
+
+MANIFEST_TEMPLATE = """\
+# generated by tools/build_mpy.py
+include("$(MPY_DIR)/ports/{port}/boards/manifest.py")
+package("pawpaw", base_path="{base_path}", opt={opt})
+"""
+
+MANIFEST_MODULE = 'module("{name}", base_path="{base_path}", opt={opt})\n'
+
+def walk_package(package_dir = PACKAGE_DIR):
+    #yields the paths of the package files relative to its parent directory
+    parent = os.path.dirname(package_dir)
+    for dirpath, dirnames, filenames in os.walk(package_dir):
+        dirnames[:] = sorted(d for d in dirnames if not d in SKIP_DIRS)
+        for fn in sorted(filenames):
+            if fn.endswith(('.pyc', '.pyo')):
+                continue
+            yield os.path.relpath(os.path.join(dirpath, fn), parent)
+
+def compiled_templates(templates_dir = TEMPLATES_DIR):
+    #the module file names made by tools/compile_templates.py, if any
+    if not os.path.isdir(templates_dir):
+        return []
+    return sorted(fn for fn in os.listdir(templates_dir) if fn.endswith('.py'))
+
+def compile_file(mpy_cross, src, dst, opt = 1, march = None):
+    cmd = [mpy_cross, "-O%d" % opt, "-o", dst]
+    if march:
+        cmd.append("-march=%s" % march)
+    #the source name recorded in the bytecode, shown in tracebacks
+    cmd.extend(["-s", os.path.relpath(src, _ROOT), src])
+    subprocess.check_call(cmd)
+
+def build(mpy_cross = "mpy-cross", opt = 1, march = None, out_dir = BUILD_DIR):
+    pkg_out = os.path.join(out_dir, 'pawpaw')
+    if os.path.isdir(pkg_out):
+        shutil.rmtree(pkg_out)
+    parent = os.path.dirname(PACKAGE_DIR)
+    sizes = [0, 0] #source bytes, output bytes
+    for relpath in walk_package():
+        src = os.path.join(parent, relpath)
+        dst = os.path.join(out_dir, relpath)
+        dst_dir = os.path.dirname(dst)
+        if not os.path.isdir(dst_dir):
+            os.makedirs(dst_dir)
+        if relpath.endswith('.py'):
+            dst = dst[:-3] + '.mpy'
+            compile_file(mpy_cross, src, dst, opt = opt, march = march)
+            sizes[0] += os.path.getsize(src)
+            sizes[1] += os.path.getsize(dst)
+        else:
+            shutil.copyfile(src, dst)
+    for fn in compiled_templates():
+        src = os.path.join(TEMPLATES_DIR, fn)
+        dst = os.path.join(out_dir, fn[:-3] + '.mpy')
+        compile_file(mpy_cross, src, dst, opt = opt, march = march)
+        sizes[0] += os.path.getsize(src)
+        sizes[1] += os.path.getsize(dst)
+    return sizes
+
+def write_manifest(port, opt = 1, out_dir = BUILD_DIR):
+    #the frozen build compiles the sources itself, so it points at them
+    path = os.path.join(out_dir, 'manifest.py')
+    with open(path, 'w') as f:
+        f.write(MANIFEST_TEMPLATE.format(port = port, opt = opt,
+                                         base_path = _ROOT))
+        for fn in compiled_templates():
+            f.write(MANIFEST_MODULE.format(name = fn, opt = opt,
+                                           base_path = TEMPLATES_DIR))
+    return path
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description = "precompile pawpaw with mpy-cross")
+    parser.add_argument("--mpy-cross", default = "mpy-cross",
+                        help = "mpy-cross executable, it must match the firmware version")
+    parser.add_argument("-O", "--opt", type = int, default = 1,
+                        help = "optimization level, 1 or more drops tracing")
+    parser.add_argument("--march", default = None,
+                        help = "native architecture, e.g. xtensa or armv7m")
+    parser.add_argument("--out", default = BUILD_DIR)
+    parser.add_argument("--manifest", action = "store_true",
+                        help = "also write a frozen module manifest")
+    parser.add_argument("--port", default = "esp8266",
+                        help = "port whose board manifest the manifest includes")
+    args = parser.parse_args()
+    if shutil.which(args.mpy_cross) is None:
+        sys.exit("%s not found, install it with `pip install mpy-cross`" % args.mpy_cross)
+    src_size, mpy_size = build(mpy_cross = args.mpy_cross, opt = args.opt,
+                               march = args.march, out_dir = args.out)
+    print("compiled %d source bytes to %d bytecode bytes in %s" %
+          (src_size, mpy_size, args.out))
+    if args.manifest:
+        print("wrote %s" % write_manifest(args.port, opt = args.opt,
+                                          out_dir = args.out))
+
+if __name__ == "__main__":
+    main()
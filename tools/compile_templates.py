@@ -0,0 +1,114 @@
+# Compiles template files ahead of time into Python modules, for use with
+# pawpaw.template_engine.CompiledTemplate:
+#     python3 tools/compile_templates.py pawpaw/test_data/pins.html [...] [--out DIR]
+# Each file becomes a module named after it (pins.html -> pins_html.py) in
+# build/templates/ by default, holding the literal text between the tags as
+# bytes constants and a `render(tag_replacements)` generator yielding them
+# with the replacements spliced in.  Put the modules on the board's path, or
+# freeze them (build_mpy.py --manifest adds the directory) so that their
+# literals stay in flash:
+#     tmp = CompiledTemplate.from_module("pins_html")
+#     context.render_template(tmp.format(comment = "hello", ...))
+import sys
+
+try:
+    import os
+    _ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+except AttributeError: #micropython has no os.path, assume the repo root
+    _ROOT = "."
+if not _ROOT in sys.path:
+    sys.path.insert(0, _ROOT)
+
+from pawpaw.template_engine import scan_tag
+
+#literals longer than this are split over several constants, keeping each
+#chunk the writer sends reasonably small
+MAX_LITERAL = 1024
+
+MODULE_HEAD = """\
+# generated by tools/compile_templates.py from %s, do not edit
+from pawpaw.template_engine import splice
+"""
+
+def module_name(filename):
+    #pins.html -> pins_html
+    base = filename.replace("\\", "/").split("/")[-1]
+    name = "".join(c if c.isalnum() else "_" for c in base)
+    if name[0].isdigit():
+        name = "_" + name
+    return name
+
+def parse(text):
+    #splits the text in a list of ('text', literal) and ('tag', name, tag_text)
+    items = []
+    at_pos = 0
+    while True:
+        tag_start_pos, tag_end_pos, tag_name = scan_tag(text, at_pos)
+        if tag_start_pos == -1:
+            break
+        if tag_start_pos > at_pos:
+            items.append(('text', text[at_pos:tag_start_pos]))
+        items.append(('tag', tag_name, text[tag_start_pos:tag_end_pos]))
+        at_pos = tag_end_pos
+    if at_pos < len(text):
+        items.append(('text', text[at_pos:]))
+    return items
+
+def compile_template(text, source = "<string>"):
+    #returns the source code of the module rendering `text`
+    consts = []
+    body   = []
+    tags   = []
+    for item in parse(text):
+        if item[0] == 'text':
+            data = bytes(item[1], 'utf8')
+            for pos in range(0, len(data), MAX_LITERAL):
+                name = "_S%d" % len(consts)
+                consts.append("%s = %r" % (name, data[pos:pos + MAX_LITERAL]))
+                body.append("    yield %s" % name)
+        else:
+            tag_name, tag_text = item[1], item[2]
+            if not tag_name in tags:
+                tags.append(tag_name)
+            name = "_T%d" % len(consts)
+            consts.append("%s = %r" % (name, bytes(tag_text, 'utf8')))
+            body.append("    yield from splice(get(%r), %s)" % (tag_name, name))
+    buff = [MODULE_HEAD % source]
+    buff.extend(consts)
+    buff.append("")
+    buff.append("TAGS = %r" % (tuple(tags),))
+    buff.append("")
+    buff.append("def render(tag_replacements):")
+    buff.append("    get = tag_replacements.get")
+    buff.extend(body)
+    if not body:
+        buff.append("    return")
+        buff.append("    yield")
+    buff.append("")
+    return "\n".join(buff)
+
+def compile_file(filename, out_dir):
+    with open(filename, 'r') as f:
+        text = f.read()
+    source = filename
+    if filename.startswith(_ROOT):
+        source = filename[len(_ROOT):].lstrip("/")
+    path = "%s/%s.py" % (out_dir, module_name(filename))
+    with open(path, 'w') as f:
+        f.write(compile_template(text, source = source))
+    return path
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description = "compile pawpaw templates to Python modules")
+    parser.add_argument("templates", nargs = "+", help = "template files")
+    parser.add_argument("--out", default = os.path.join(_ROOT, "build", "templates"),
+                        help = "directory the modules are written to")
+    args = parser.parse_args()
+    if not os.path.isdir(args.out):
+        os.makedirs(args.out)
+    for filename in args.templates:
+        print("%s -> %s" % (filename, compile_file(os.path.abspath(filename), args.out)))
+
+if __name__ == "__main__":
+    main()